@@ -0,0 +1,153 @@
+from asyncio import wrap_future
+from concurrent.futures import Future
+from dataclasses import dataclass
+from logging import getLogger
+from subprocess import CompletedProcess
+from threading import Lock
+from time import monotonic
+
+from ..ssh import SSH, AsyncSSH
+
+LOGGER = getLogger(__file__)
+
+@dataclass
+class CacheStats:
+    ''' How often queries were answered without running them '''
+    hits: int = 0
+    misses: int = 0
+    shared: int = 0
+    invalidations: int = 0
+
+    def __str__(self):
+        return f'{self.hits} hit(s), {self.misses} miss(es), ' \
+               f'{self.shared} shared in-flight, {self.invalidations} invalidation(s)'
+
+class CommandCache:
+    ''' Successful results of read-only commands, kept for `ttl` seconds.
+    Keys are (host, port, login, package, command, *args) '''
+    DEFAULT_TTL = 30.0
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.pending = {}
+        self.generation = 0
+        self.stats = CacheStats()
+        self.lock = Lock()
+
+    @staticmethod
+    def key(creds: 'SSHCreds', *command: tuple[str]):
+        return (creds.host, creds.port, creds.login, *command)
+
+    @staticmethod
+    def supports(ssh):
+        # batched calls are not cached
+        return isinstance(ssh, (SSH, AsyncSSH))
+
+    def get(self, key: tuple, call: 'Callable[[], CompletedProcess]'):
+        ''' Return cached result of the call or run it,
+        identical calls running at the same time share one result '''
+        res, future, generation = self._lookup(key)
+        if res is not None:
+            return res
+        if generation is None:
+            return future.result()
+        try:
+            res = call()
+        except BaseException as ex:
+            self._store(key, future, generation, ex=ex)
+            raise
+        return self._store(key, future, generation, res)
+
+    async def get_async(self, key: tuple, call: 'Callable[[], Awaitable[CompletedProcess]]'):
+        ''' Same as get for calls over asyncio transport '''
+        res, future, generation = self._lookup(key)
+        if res is not None:
+            return res
+        if generation is None:
+            return await wrap_future(future)
+        try:
+            res = await call()
+        except BaseException as ex:
+            self._store(key, future, generation, ex=ex)
+            raise
+        return self._store(key, future, generation, res)
+
+    def get_stream(self,
+                   key: tuple,
+                   stream: 'Callable[[], Generator[bytes, None, CompletedProcess]]'):
+        ''' Same as get for streamed calls. Chunks are yielded as they arrive,
+        the whole output is cached once the call succeeds '''
+        res, future, generation = self._lookup(key)
+        if res is None and generation is None:
+            res = future.result()
+        if res is not None:
+            if res.stdout:
+                yield res.stdout
+            return res
+        chunks = []
+        proc = stream()
+        try:
+            while True:
+                try:
+                    chunk = next(proc)
+                except StopIteration as stop:
+                    res = stop.value
+                    break
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as ex:
+            # also when the reader stops early, the call is not finished then
+            proc.close()
+            self._store(key, future, generation, ex=ex)
+            raise
+        res = CompletedProcess(res.args, res.returncode, b''.join(chunks), res.stderr)
+        return self._store(key, future, generation, res)
+
+    def _lookup(self, key: tuple):
+        ''' Return (cached result, None, None), (None, in-flight future, None)
+        or (None, new future, generation) if the caller has to run the call '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > monotonic():
+                self.stats.hits += 1
+                return entry[1], None, None
+            future = self.pending.get(key)
+            if future:
+                self.stats.shared += 1
+                return None, future, None
+            self.stats.misses += 1
+            future = self.pending[key] = Future()
+            return None, future, self.generation
+
+    def _store(self, key, future, generation, res=None, ex=None):
+        with self.lock:
+            del self.pending[key]
+            # result may be stale if a command changed data meanwhile
+            if ex is None and not res.returncode and generation == self.generation:
+                self.entries[key] = (monotonic() + self.ttl, res)
+        if ex is None:
+            future.set_result(res)
+        else:
+            future.set_exception(ex)
+        return res
+
+    def invalidate(self, creds: 'SSHCreds', *prefixes: tuple[str]):
+        ''' Drop results of commands that start with any of prefixes '''
+        server = (creds.host, creds.port)
+        with self.lock:
+            self.generation += 1
+            self.stats.invalidations += 1
+            for key in list(self.entries):
+                command = key[3:]
+                if key[:2] == server and any(
+                        command[:len(prefix)] == prefix for prefix in prefixes):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+        LOGGER.info('Command cache: %s', self.stats)
+
+CACHE = CommandCache()
@@ -74,7 +74,7 @@ class RepoAllowedError(CommandError):
     ERR_MSG = 'Repo is allowed'
 
 class RepoNotAllowedError(CommandError):
-    ESS_MSG = 'Repo is not allowed'
+    ERR_MSG = 'Repo is not allowed'
 
 SPECIFIC = [
     InvalidLoginError,
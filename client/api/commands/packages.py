@@ -1,54 +1,88 @@
 from .utils import (
-        action, value_request, list_request, table_request, Package
+        action, value_request, list_request, table_request, report_request,
+        list_stream, table_stream, invalidates, Package
 )
 
+def encode_lines(*groups: tuple[str, 'Iterable[str]']):
+    ''' Encode items as "<op> <item>" lines for bulk commands '''
+    return ''.join(
+            f'{op} {item}\n'
+            for op, items in groups
+            for item in items
+    ).encode('utf-8')
+
+# promotion changes roles, user list and access of the promoted
+ADMIN_CHANGES = [('user', 'list'), ('self',), ('access',)]
+
 class AccessPackage(Package):
     def __init__(self, ssh: 'SSH'):
         super().__init__(ssh, 'access')
 
+    @invalidates(lambda login, repo: [
+            ('access', 'users', repo), ('access', 'repos', login), ('self', 'repos')])
     @action
     def allow(self, login: str, repo: str):
         return self._ssh('allow', login, repo)
 
+    @invalidates(lambda login, repo: [
+            ('access', 'users', repo), ('access', 'repos', login), ('self', 'repos')])
     @action
     def deny(self, login: str, repo: str):
         return self._ssh('deny', login, repo)
 
+    @invalidates(lambda repo, allow, deny: [
+            ('access', 'users', repo), ('access', 'repos'), ('self', 'repos')])
+    @report_request
+    def apply(self, repo: str, allow: 'Iterable[str]', deny: 'Iterable[str]'):
+        return self._ssh('apply', repo,
+                         input=encode_lines(('allow', allow), ('deny', deny)))
+
     @list_request
     def repos(self, login: str):
-        return self._ssh('repos', login)
+        return self._query('repos', login)
 
     @list_request
     def users(self, repo: str):
-        return self._ssh('users', repo)
+        return self._query('users', repo)
 
 class AdminPackage(Package):
     def __init__(self, ssh: 'SSH'):
         super().__init__(ssh, 'admin')
 
+    @invalidates(lambda login: ADMIN_CHANGES)
     @action
     def promote(self, login: str):
         return self._ssh('promote', login)
 
+    @invalidates(lambda login: ADMIN_CHANGES)
     @action
     def demote(self, login: str):
         return self._ssh('demote', login)
 
+    @invalidates(lambda promote, demote: ADMIN_CHANGES)
+    @report_request
+    def apply(self, promote: 'Iterable[str]', demote: 'Iterable[str]'):
+        return self._ssh('apply',
+                         input=encode_lines(('promote', promote), ('demote', demote)))
+
 class RepoPackage(Package):
     def __init__(self, ssh: 'SSH'):
         super().__init__(ssh, 'repo')
 
+    @invalidates(lambda repo: [('repo', 'list'), ('self', 'repos')])
     @action
     def create(self, repo: str):
         return self._ssh('create', repo)
 
+    @invalidates(lambda repo: [
+            ('repo', 'list'), ('self', 'repos'), ('access', 'users', repo), ('access', 'repos')])
     @action
     def delete(self, repo: str):
         return self._ssh('delete', repo)
 
     @list_request
     def list(self):
-        return self._ssh('list')
+        return self._query('list')
 
 class SelfPackage(Package):
     def __init__(self, ssh: 'SSH'):
@@ -60,27 +94,38 @@ class SelfPackage(Package):
 
     @list_request
     def repos(self):
-        return self._ssh('repos')
+        return self._query('repos')
+
+    @list_stream
+    def iter_repos(self):
+        return self._query_stream('repos')
 
     @value_request
     def role(self):
+        # not cached, login checks creds with it
         return self._ssh('role')
 
 class UserPackage(Package):
     def __init__(self, ssh: 'SSH'):
         super().__init__(ssh, 'user')
 
+    @invalidates(lambda login, password: [('user', 'list')])
     @action
     def create(self, login: str, password: str):
         return self._ssh('create', login, password)
 
+    @invalidates(lambda login: [('user', 'list'), ('access', 'users'), ('access', 'repos', login)])
     @action
     def delete(self, login: str):
         return self._ssh('delete', login)
 
     @table_request
     def list(self):
-        return self._ssh('list')
+        return self._query('list')
+
+    @table_stream
+    def iter_list(self):
+        return self._query_stream('list')
 
     @action
     def passwd(self, login: str, password: str):
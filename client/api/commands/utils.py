@@ -1,87 +1,329 @@
-from inspect import getmembers, ismethod
+from inspect import getmembers, ismethod, isawaitable
+from contextlib import contextmanager
 from dataclasses import dataclass
 from functools import wraps
+from subprocess import CompletedProcess
 import re
 
+from ..ssh import CONNECTIONS, SSH, AsyncSSH
+from .cache import CACHE
 from .error import *
 
+# Commands print NUL-terminated records with tab-separated fields
+OUTPUT_FLAG = '--null'
+RECORD_END = b'\0'
+FIELD_SEP = b'\t'
+
 @dataclass(frozen=True)
 class Package:
     ''' Class that represents command package '''
     ssh: 'SSH'
     pkg_name: str
 
-    def _ssh(self, command: str, *args: tuple[str]):
-        return self.ssh.run(self.pkg_name, command, *args)
+    def _ssh(self, command: str, *args: tuple[str], input: bytes=None):
+        return self.ssh.run(self.pkg_name, OUTPUT_FLAG, command, *args, input=input)
+
+    def _ssh_stream(self, command: str, *args: tuple[str]):
+        return self.ssh.stream(self.pkg_name, OUTPUT_FLAG, command, *args)
+
+    def _query(self, command: str, *args: tuple[str]):
+        ''' Run read-only command, its successful result is cached '''
+        if not CACHE.supports(self.ssh):
+            return self._ssh(command, *args)
+        key = CACHE.key(self.ssh.creds, self.pkg_name, command, *args)
+        if isinstance(self.ssh, AsyncSSH):
+            return CACHE.get_async(key, lambda: self._ssh(command, *args))
+        return CACHE.get(key, lambda: self._ssh(command, *args))
+
+    def _query_stream(self, command: str, *args: tuple[str]):
+        ''' Stream read-only command, its successful output is cached whole '''
+        if not isinstance(self.ssh, SSH):
+            return self._ssh_stream(command, *args)
+        key = CACHE.key(self.ssh.creds, self.pkg_name, command, *args)
+        return CACHE.get_stream(key, lambda: self._ssh_stream(command, *args))
+
+    def invalidate(self, *prefixes: tuple[str]):
+        ''' Drop cached results of the package commands that start with prefixes,
+        all of them if no prefix is given '''
+        CACHE.invalidate(self.ssh.creds, *(
+                (self.pkg_name, *prefix) for prefix in prefixes or [()]
+        ))
+
+    def asynchronous(self):
+        ''' Return the package over the session's asyncio transport, its calls
+        are awaitable. Packages of a session share its command limit '''
+        return type(self)(CONNECTIONS.transport(self.ssh))
+
+    @contextmanager
+    def batch(self):
+        ''' Yield the package bound to a batch that is sent on exit '''
+        with Batch(self.ssh) as batch:
+            yield type(self)(batch)
+
+class BatchItem:
+    ''' Result of a queued call, available after its batch is sent '''
+    def __init__(self, command: tuple[str]):
+        self.command = command
+        self.parse = None
+        self.done = False
+        self.value = None
+        self.error = None
+        self.callbacks = []
+
+    def then(self, parse):
+        self.parse = parse
+        return self
+
+    def on_done(self, callback: 'Callable[[], None]'):
+        ''' Call callback once the call is resolved or failed '''
+        self.callbacks.append(callback)
+        return self
+
+    def resolve(self, res: 'CompletedProcess'):
+        try:
+            self.value = self.parse(res) if self.parse else res
+        except CommandError as ex:
+            self.error = ex
+        except Exception as ex:
+            # malformed output fails only this call, the rest of the batch resolves
+            self.error = CommandError('Unexpected output', *self.command)
+            self.error.__cause__ = ex
+        self.finish()
+
+    def fail(self, ex: Exception):
+        self.error = ex
+        self.finish()
+
+    def finish(self):
+        self.done = True
+        for callback in self.callbacks:
+            callback()
 
-def handle_fail(method, *args, **kw):
+    def result(self):
+        ''' Return parsed result or raise the exception of the call '''
+        if not self.done:
+            raise RuntimeError('Batch was not sent')
+        if self.error:
+            raise self.error
+        return self.value
+
+class Batch:
+    ''' Queue of package commands that are sent in one SSH round trip '''
+    def __init__(self, ssh: 'SSH'):
+        self.ssh = ssh
+        self.items = []
+        self.sent = []
+
+    @property
+    def creds(self):
+        return self.ssh.creds
+
+    def run(self, *command: tuple[str], input: bytes=None):
+        if input is not None:
+            raise ValueError('Commands with input cannot be batched')
+        for arg in command:
+            if not arg or '\t' in arg or '\n' in arg:
+                raise ValueError(f'Argument cannot be batched: {arg!r}')
+        item = BatchItem(command)
+        self.items.append(item)
+        return item
+
+    def send(self):
+        items, self.items = self.items, []
+        self.sent = items
+        if not items:
+            return items
+        request = ''.join(
+                '\t'.join(item.command) + '\n' for item in items
+        ).encode('utf-8')
+        try:
+            res = handle_fail(self.ssh.run('batch', input=request))
+        except Exception as ex:
+            # some commands may have run before the failure
+            for item in items:
+                item.fail(ex)
+            raise
+        results = decode_batch(res.stdout, (item.command for item in items))
+        for item, item_res in zip(items, results):
+            item.resolve(item_res)
+        for item in items:
+            if not item.done:
+                item.fail(CommandError('No result for batched command', *item.command))
+        return items
+
+    def results(self):
+        ''' Results of the sent calls in order, exceptions in place of failed ones '''
+        return [item.error or item.value for item in self.sent]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex, traceback):
+        if ex_type is None:
+            self.send()
+
+def decode_batch(data: bytes, commands: 'Iterable[tuple[str]]'):
+    ''' Split batch output to results of separate commands '''
+    pos = 0
+    for command in commands:
+        try:
+            end = data.index(b'\n', pos)
+            code, out_size, err_size = map(int, data[pos:end].split())
+        except ValueError:
+            return
+        out_start = end + 1
+        err_start = out_start + out_size
+        pos = err_start + err_size
+        yield CompletedProcess(command, code, data[out_start:err_start], data[err_start:pos])
+
+def handle_fail(res: 'CompletedProcess'):
     ''' Handle possible failure or return call result '''
-    res = method(*args, **kw)
     print(res)
     if not res.returncode:
         return res
     parse_and_raise(res)
-    raise CommandError(f'{cmd_name} failed', res.stderr, *args, **kw)
 
-def action(method):
-    ''' Check that call via SSH was successful '''
+def handle_result(method, parse):
+    ''' Wrap package method to parse its result,
+    deferred for batched calls and awaitable for asyncio transport '''
+    async def parse_awaited(res):
+        return parse(handle_fail(await res))
+
     @wraps(method)
     def inner(*args, **kw):
-        handle_fail(method, *args, **kw)
+        res = method(*args, **kw)
+        if isinstance(res, BatchItem):
+            return res.then(lambda res: parse(handle_fail(res)))
+        if isawaitable(res):
+            return parse_awaited(res)
+        return parse(handle_fail(res))
     inner._pkg_decorated = True
     return inner
 
+def invalidates(prefixes: 'Callable[..., Iterable[tuple[str]]]'):
+    ''' Drop cached results of queries that the decorated command changes.
+    `prefixes` maps command's args to (package, command, *args) prefixes '''
+    def decorator(method):
+        async def invalidate_awaited(self, res, keys):
+            try:
+                return await res
+            finally:
+                CACHE.invalidate(self.ssh.creds, *keys)
+
+        @wraps(method)
+        def inner(self, *args, **kw):
+            keys = list(prefixes(*args, **kw))
+            try:
+                res = method(self, *args, **kw)
+            except BaseException:
+                CACHE.invalidate(self.ssh.creds, *keys)
+                raise
+            if isinstance(res, BatchItem):
+                # also when the batch fails, its commands may have run
+                return res.on_done(lambda: CACHE.invalidate(self.ssh.creds, *keys))
+            if isawaitable(res):
+                return invalidate_awaited(self, res, keys)
+            CACHE.invalidate(self.ssh.creds, *keys)
+            return res
+        return inner
+    return decorator
+
+def action(method):
+    ''' Check that call via SSH was successful '''
+    return handle_result(method, lambda res: None)
+
 def decode_bytes(b: bytes) -> str:
     return b.decode('utf-8')
 
+def decode_record(record: bytes) -> list[str]:
+    return list(map(decode_bytes, record.split(FIELD_SEP)))
+
+def decode_records(data: bytes) -> list[list[str]]:
+    ''' Parse records printed by list and table commands '''
+    decoder = RecordDecoder()
+    return [*decoder.feed(data), *decoder.finish()]
+
+class RecordDecoder:
+    ''' Incremental decoder of records that arrive in chunks '''
+    def __init__(self):
+        self.tail = b''
+
+    def feed(self, chunk: bytes):
+        *records, self.tail = (self.tail + chunk).split(RECORD_END)
+        return list(map(decode_record, records))
+
+    def finish(self):
+        tail, self.tail = self.tail, b''
+        return [decode_record(tail)] if tail else []
+
 def value_request(method):
     ''' Parse successful call's result to a single value '''
-    @wraps(method)
-    def inner(*args, **kw):
-        res = handle_fail(method, *args, **kw)
-        return decode_bytes(res.stdout.strip())
-    inner._pkg_decorated = True
-    return inner
+    return handle_result(method, lambda res: decode_records(res.stdout)[0][0])
 
 def list_request(method):
     ''' Parse successful call's result to a list of values '''
-    @wraps(method)
-    def inner(*args, **kw):
-        res = handle_fail(method, *args, **kw)
-        return list(map(decode_bytes, res.stdout.strip().split()))
-    inner._pkg_decorated = True
-    return inner
+    return handle_result(
+            method,
+            lambda res: [record[0] for record in decode_records(res.stdout)]
+    )
+
+def report_request(method):
+    ''' Parse successful bulk call's result to a map of failed items to errors '''
+    def parse(res):
+        report = {}
+        for line in decode_bytes(res.stdout).splitlines():
+            op, item, error = line.split('\t', 2)
+            report[item] = parse_error(error)
+        return report
+    return handle_result(method, parse)
 
 def table_request(method):
     ''' Parse successful call's result to a table of values '''
+    return handle_result(method, lambda res: decode_records(res.stdout))
+
+def stream_result(method, to_value):
+    ''' Wrap streaming package method to yield values as records arrive '''
     @wraps(method)
     def inner(*args, **kw):
-        res = handle_fail(method, *args, **kw)
-        return [
-                list(map(decode_bytes, line.split()))
-                for line in res.stdout.strip().split(b'\n')
-        ]
+        chunks = method(*args, **kw)
+        decoder = RecordDecoder()
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                handle_fail(stop.value)
+                break
+            yield from map(to_value, decoder.feed(chunk))
+        yield from map(to_value, decoder.finish())
     inner._pkg_decorated = True
     return inner
 
+def list_stream(method):
+    ''' Yield values of a list request as they arrive '''
+    return stream_result(method, lambda record: record[0])
+
+def table_stream(method):
+    ''' Yield rows of a table request as they arrive '''
+    return stream_result(method, lambda record: record)
+
 def parse_and_raise(res: 'CompletedProcess'):
     ''' Try to parse specific exception, fallback to CommandError(stderr) '''
-    stderr = res.stderr.decode('utf-8')
+    raise parse_error(res.stderr.decode('utf-8'))
+
+def parse_error(stderr: str) -> CommandError:
+    ''' Parse error message printed by a validator '''
     try:
-        # error caught by validator
         cmd, msg, args = stderr.split(': ', 2)
-        ex_type = SPECIFIC_MAP.get(msg, None)
-        args = parse_args(args)
-        raise ex_type(**args)
     except ValueError:
-        raise CommandError(stderr)
+        return CommandError(stderr)
+    ex_type = SPECIFIC_MAP.get(msg, None)
+    if ex_type is None:
+        return CommandError(stderr)
+    try:
+        return ex_type(**parse_args(args))
+    except TypeError:
+        return CommandError(stderr)
 
 def parse_args(arg_string: str):
     ''' Parse exception arguments '''
-    def parse_pair(pair_str):
-        name, value = re.match(r'(\w+)=`(.+)`', pair_str).groups()
-        return name, value
-    return {
-            name: value
-            for name, value in map(parse_pair, arg_string.split(' '))
-    }
+    return dict(re.findall(r'(\w+)=`([^`]*)`', arg_string))
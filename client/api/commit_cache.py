@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+import json
+import sqlite3
+
+LOGGER = getLogger(__file__)
+
+class LRUCache:
+    ''' Mapping that forgets least recently used entries over maxsize '''
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class CommitStore:
+    ''' Data derived from commits, kept in an SQLite file inside the repo's git dir '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS commit_data(
+            hexsha TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (hexsha, kind)
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def get(self, hexsha: str, kind: str):
+        with self.lock:
+            row = self.db.execute(
+                    'SELECT value FROM commit_data WHERE hexsha = ? AND kind = ?',
+                    (hexsha, kind)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, hexsha: str, kind: str, value):
+        with self.lock:
+            self.db.execute(
+                    'INSERT OR REPLACE INTO commit_data VALUES (?, ?, ?)',
+                    (hexsha, kind, json.dumps(value)))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class CommitCache:
+    ''' Results of git queries about commits, keyed by (git dir, kind, hexsha).
+    Commits are immutable, so entries never go stale '''
+    DEFAULT_SIZE = 1024
+    STORE_NAME = 'config_sync.sqlite3'
+
+    def __init__(self, maxsize: int = DEFAULT_SIZE, persistent: bool = True):
+        self.memory = LRUCache(maxsize)
+        self.persistent = persistent
+        self.stores = {}
+        self.lock = Lock()
+
+    def store(self, git_dir: str):
+        ''' Return on-disk store of the repo, None if disabled or unavailable '''
+        if not self.persistent:
+            return None
+        with self.lock:
+            if git_dir not in self.stores:
+                path = Path(git_dir) / self.STORE_NAME
+                try:
+                    self.stores[git_dir] = CommitStore(path)
+                except sqlite3.Error:
+                    LOGGER.warning('Failed to open commit cache: %s', path)
+                    self.stores[git_dir] = None
+            return self.stores[git_dir]
+
+    def get(self, git_dir: str, kind: str, hexsha: str, compute: 'Callable[[], object]'):
+        ''' Return cached value or compute it, values must be JSON serializable '''
+        key = (git_dir, kind, hexsha)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        store = self.store(git_dir)
+        try:
+            value = store.get(hexsha, kind) if store else None
+        except sqlite3.Error:
+            LOGGER.warning('Failed to read commit cache of %s', git_dir)
+        if value is None:
+            value = compute()
+            if store:
+                try:
+                    store.put(hexsha, kind, value)
+                except sqlite3.Error:
+                    LOGGER.warning('Failed to write commit cache of %s', git_dir)
+        self.memory.put(key, value)
+        return value
+
+    def close(self):
+        with self.lock:
+            for store in filter(None, self.stores.values()):
+                store.close()
+            self.stores.clear()
+
+COMMITS = CommitCache()
+# parsed patches of recently viewed commits
+PATCHES = LRUCache(16)
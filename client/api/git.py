@@ -1,14 +1,414 @@
-from git import Repo
+from codecs import escape_decode
+from contextlib import contextmanager
+from itertools import islice
+from logging import getLogger
+from pathlib import Path
+from string import hexdigits
+from subprocess import PIPE
+from threading import Lock
+from time import perf_counter
+import re
+import sqlite3
+
+from git import Git, Repo, RemoteProgress
+from git.cmd import handle_process_output
 from git.exc import GitCommandError, BadName
 
-from .ssh import SSHCmdBits, SSHCreds
+from .commit_cache import COMMITS, PATCHES
+from .history_index import HistoryIndex
+from .ssh import CONNECTIONS, SSHCmdBits, SSHCreds
+from common import CloneMode
+
+LOGGER = getLogger(__file__)
 
 def get_repo_url(creds: 'SSHCreds', repo_name: str):
     return f'ssh://{creds.login}@{creds.host}:{creds.port}' \
            f'/~{creds.login}/repos/{repo_name}'
 
-def get_ssh_cmd(cmd_bits: 'SSHCmdBits', creds: 'SSHCreds'):
-    return (*cmd_bits.passwd_pipe, creds.password, *cmd_bits.ssh_opts)
+def get_ssh_cmd(cmd_bits: 'SSHCmdBits', creds: 'SSHCreds', master: 'SSHMaster' = None):
+    mux_opts = master.options() if master else ()
+    return (*cmd_bits.passwd_pipe, creds.password, *cmd_bits.ssh_opts, *mux_opts)
+
+@contextmanager
+def timed_transfer(master: 'SSHMaster'):
+    ''' Account git transfer as a command run over the master '''
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        if master:
+            master.add_command_time(perf_counter() - start)
+
+class GitProgress(RemoteProgress):
+    ''' Forward git's --progress output to a callback, terminate git on cancel '''
+    STAGES = {
+            RemoteProgress.COUNTING: 'Counting objects',
+            RemoteProgress.COMPRESSING: 'Compressing objects',
+            RemoteProgress.WRITING: 'Writing objects',
+            RemoteProgress.RECEIVING: 'Receiving objects',
+            RemoteProgress.RESOLVING: 'Resolving deltas',
+            RemoteProgress.FINDING_SOURCES: 'Finding sources',
+            RemoteProgress.CHECKING_OUT: 'Checking out files',
+    }
+
+    def __init__(self, callback: 'Callable[[int, int, str], None]' = None):
+        super().__init__()
+        self.callback = callback
+        self.label = ''
+        self.proc = None
+        self.cancelled = False
+
+    def update(self, op_code, cur_count, max_count=None, message=''):
+        if self.callback:
+            stage = self.STAGES.get(op_code & self.OP_MASK, '')
+            text = f'{self.label}: {stage}' if self.label else stage
+            self.callback(int(cur_count), int(max_count or 0), text)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.proc:
+            self.proc.terminate()
+
+def run_with_progress(git: Git, command: str, *args, progress: GitProgress = None, **kw):
+    ''' Run git transfer command, reporting its progress if requested '''
+    if progress is None:
+        return getattr(git, command)(*args, **kw)
+    if progress.cancelled:
+        raise GitCommandError(['git', command], 'cancelled')
+    proc = getattr(git, command)('--progress', *args, as_process=True, **kw)
+    progress.proc = proc.proc
+    try:
+        handle_process_output(
+                proc, lambda line: None, progress.new_message_handler(),
+                decode_streams=False
+        )
+        proc.wait(stderr=''.join(progress.error_lines))
+    finally:
+        progress.proc = None
+
+class Revision:
+    ''' Commit as listed by revision walk '''
+    __slots__ = ('hexsha', 'summary', 'parents', 'author_time')
+
+    def __init__(self, hexsha: str, summary: str, parents: tuple[str], author_time: int):
+        self.hexsha = hexsha
+        self.summary = summary
+        self.parents = parents
+        self.author_time = author_time
+
+    def __repr__(self):
+        return f'Revision({self.hexsha[:7]}, {self.summary!r})'
+
+# NUL separated fields, -z ends each record with NUL as well
+REVISION_FORMAT = '--format=%H%x00%P%x00%at%x00%s'
+REVISION_FIELDS = 4
+READ_SIZE = 1 << 16
+
+def walk_revisions(git: Git,
+                   *revisions: str,
+                   skip: int = 0,
+                   max_count: int = None,
+                   first_parent: bool = False,
+                   all_refs: bool = False):
+    ''' Stream commits from a single git log as Revision records '''
+    args = ['-z', REVISION_FORMAT]
+    if skip:
+        args.append(f'--skip={skip}')
+    if max_count is not None:
+        args.append(f'--max-count={max_count}')
+    if first_parent:
+        args.append('--first-parent')
+    if all_refs:
+        args.append('--all')
+    proc = git.log(*args, *revisions, '--', as_process=True)
+    stdout = proc.proc.stdout
+    try:
+        fields = []
+        tail = b''
+        for chunk in iter(lambda: stdout.read1(READ_SIZE), b''):
+            *parts, tail = (tail + chunk).split(b'\0')
+            fields.extend(parts)
+            records = len(fields) // REVISION_FIELDS * REVISION_FIELDS
+            for idx in range(0, records, REVISION_FIELDS):
+                hexsha, parents, author_time, summary = fields[idx:idx + REVISION_FIELDS]
+                yield Revision(
+                        hexsha.decode(),
+                        summary.decode(errors='replace'),
+                        tuple(parents.decode().split()),
+                        int(author_time)
+                )
+            del fields[:records]
+        proc.wait()
+    finally:
+        # walk abandoned midway
+        if proc.proc.poll() is None:
+            proc.proc.kill()
+            proc.proc.wait()
+
+class CommitPatch:
+    ''' Patch of a whole commit in one buffer, indexed by byte ranges of file diffs '''
+    __slots__ = ('buffer', 'offsets')
+
+    FILE_HEADER = b'diff --git '
+    HUNK_STARTS = (b'@@', b'Binary files')
+
+    def __init__(self, buffer: bytes = None):
+        # buffer is None for patches over the size limit
+        self.buffer = buffer
+        self.offsets = {}
+        if buffer is not None:
+            self._index()
+
+    @property
+    def oversize(self):
+        return self.buffer is None
+
+    @classmethod
+    def header_path(cls, header: bytes):
+        ''' Path from 'diff --git a/path b/path', both sides are equal without renames '''
+        names = header[len(cls.FILE_HEADER):]
+        return unquote_path(names[:(len(names) - 1) // 2]).removeprefix('a/')
+
+    def _index(self):
+        buffer = self.buffer
+        start = 0 if buffer.startswith(self.FILE_HEADER) else buffer.find(b'\n' + self.FILE_HEADER) + 1
+        while start > 0 or buffer.startswith(self.FILE_HEADER):
+            header_end = buffer.find(b'\n', start)
+            end = buffer.find(b'\n' + self.FILE_HEADER, start) + 1 or len(buffer)
+            path = self.header_path(buffer[start:header_end if header_end >= 0 else end])
+            # skip extended headers, keep hunks or the binary notice
+            body = end
+            line = header_end + 1
+            while 0 < line < end:
+                if buffer.startswith(self.HUNK_STARTS, line):
+                    body = line
+                    break
+                line = buffer.find(b'\n', line) + 1
+            self.offsets[path] = (body, end)
+            if end == len(buffer):
+                break
+            start = end
+
+    def file_diff(self, path: str):
+        ''' Diff of the file without its header, None if the file is not in the patch '''
+        if path not in self.offsets:
+            return None
+        start, end = self.offsets[path]
+        return self.buffer[start:end].decode(errors='replace').removesuffix('\n')
+
+    def file_chunks(self, path: str, chunk_size: int = READ_SIZE):
+        ''' Lazily yield the file's diff as text chunks, see line_chunks '''
+        start, end = self.offsets[path]
+        view = memoryview(self.buffer)
+        return line_chunks(view[pos:min(pos + chunk_size, end)]
+                           for pos in range(start, end, chunk_size))
+
+def utf8_boundary(data: bytes):
+    ''' Offset of the last character's first byte, cutting there splits no character '''
+    cut = len(data) - 1
+    while cut > len(data) - 4 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    return cut
+
+def line_chunks(blocks: 'Iterable[bytes]', max_line: int = READ_SIZE):
+    ''' Join byte blocks into text chunks ending at line ends.
+    Lines over max_line bytes, e.g. of minified files, are split '''
+    tail = b''
+    for block in blocks:
+        data = tail + block
+        cut = data.rfind(b'\n') + 1
+        if not cut and len(data) > max_line:
+            cut = utf8_boundary(data)
+        if cut:
+            yield data[:cut].decode(errors='replace')
+        tail = data[cut:]
+    if tail:
+        yield tail.decode(errors='replace')
+
+# first line after the extended headers of a file patch
+HUNK_START = re.compile(r'^(?:@@|Binary files)', re.MULTILINE)
+
+def read_file_diff(proc: 'git.cmd.Git.AutoInterrupt', chunk_size: int = READ_SIZE):
+    ''' Stream text chunks of a single file patch without its header '''
+    stdout = proc.proc.stdout
+    try:
+        in_body = False
+        for text in line_chunks(iter(lambda: stdout.read(chunk_size), b''), chunk_size):
+            if not in_body:
+                body = HUNK_START.search(text)
+                if body is None:
+                    # header lines only
+                    continue
+                text = text[body.start():]
+                in_body = True
+            yield text
+        proc.wait()
+    finally:
+        # viewer moved on to another file
+        if proc.proc.poll() is None:
+            proc.proc.kill()
+            proc.proc.wait()
+
+class PatchedCommit:
+    ''' Commit message with added and removed lines of each changed file '''
+    __slots__ = ('hexsha', 'author_time', 'message', 'files')
+
+    def __init__(self, hexsha: str, author_time: int, message: str):
+        self.hexsha = hexsha
+        self.author_time = author_time
+        self.message = message
+        self.files = {}
+
+PATCHED_FORMAT = '--format=%x00%H %at%n%B%x00'
+PATCHED_OPTS = (
+        '--no-walk=unsorted', '--stdin', '--no-color', '--no-ext-diff', '--no-textconv',
+        '--no-renames', '--diff-merges=first-parent', '--src-prefix=a/', '--dst-prefix=b/'
+)
+# diff text kept per file, generated configs are cut here
+MAX_FILE_LINES_SIZE = 64 << 10
+
+def walk_patches(git: Git, hexshas: list[str], diffs: bool = True, progress: GitProgress = None):
+    ''' Stream PatchedCommits of the given commits from a single git log.
+    Without diffs only changed paths are listed, so no blobs are read '''
+    # unquoted non-ASCII paths in file headers
+    git = git(c='core.quotePath=false')
+    proc = git.log(PATCHED_FORMAT, '-p' if diffs else '--name-only', *PATCHED_OPTS, '--',
+                   as_process=True, istream=PIPE)
+    if progress:
+        progress.proc = proc.proc
+    try:
+        # revisions are read before the walk starts
+        proc.proc.stdin.write(''.join(f'{hexsha}\n' for hexsha in hexshas).encode())
+        proc.proc.stdin.close()
+        yield from parse_patches(proc.proc.stdout, diffs)
+        proc.wait()
+    finally:
+        if progress:
+            progress.proc = None
+        if proc.proc.poll() is None:
+            proc.proc.kill()
+            proc.proc.wait()
+
+def parse_patches(lines: 'Iterable[bytes]', diffs: bool):
+    commit = None
+    in_message = in_hunk = False
+    message = []
+    path = None
+    text = []
+    size = 0
+    for line in lines:
+        if in_message:
+            # message ends with NUL, on its own line unless it lacks a newline
+            if line.endswith(b'\0\n'):
+                message.append(line[:-2])
+                commit.message = b''.join(message).decode(errors='replace').strip()
+                in_message = False
+            else:
+                message.append(line)
+        elif line.startswith(b'\0'):
+            if commit:
+                if path is not None:
+                    commit.files[path] = b''.join(text).decode(errors='replace')
+                yield commit
+            hexsha, author_time = line[1:].split()
+            commit = PatchedCommit(hexsha.decode(), int(author_time), '')
+            in_message = True
+            message = []
+            path = None
+        elif not diffs:
+            name = line.rstrip(b'\n')
+            if name:
+                commit.files[unquote_path(name)] = ''
+        elif line.startswith(CommitPatch.FILE_HEADER):
+            if path is not None:
+                commit.files[path] = b''.join(text).decode(errors='replace')
+            path = CommitPatch.header_path(line.rstrip(b'\n'))
+            text = []
+            size = 0
+            in_hunk = False
+        elif line.startswith(b'@@'):
+            in_hunk = True
+        elif in_hunk and line.startswith((b'+', b'-')) and size < MAX_FILE_LINES_SIZE:
+            text.append(line[1:])
+            size += len(line)
+    if commit:
+        if path is not None:
+            commit.files[path] = b''.join(text).decode(errors='replace')
+        yield commit
+
+def unquote_path(name: bytes):
+    ''' Decode path git quoted for special characters '''
+    if name.startswith(b'"'):
+        name = escape_decode(name[1:-1])[0]
+    return name.decode(errors='replace')
+
+class GrepMatch:
+    ''' Line of a file matched by git grep '''
+    __slots__ = ('path', 'line_no', 'text')
+
+    def __init__(self, path: str, line_no: int, text: str):
+        self.path = path
+        self.line_no = line_no
+        self.text = text
+
+    def __repr__(self):
+        return f'GrepMatch({self.path}:{self.line_no})'
+
+# longer matched lines, e.g. of minified files, are cut
+MAX_GREP_LINE = 500
+
+def walk_grep(git: Git,
+              pattern: str,
+              revision: str,
+              regex: bool = False,
+              ignore_case: bool = False,
+              progress: GitProgress = None):
+    ''' Stream GrepMatches of pattern in text files of the revision's tree.
+    git is started right away, so it runs in the caller's environment '''
+    args = ['-z', '-n', '-I', '--no-color', '-E' if regex else '-F']
+    if ignore_case:
+        args.append('-i')
+    proc = git.grep(*args, '-e', pattern, revision, '--', as_process=True)
+    return read_grep(proc, revision, progress)
+
+def read_grep(proc: 'git.cmd.Git.AutoInterrupt', revision: str, progress: GitProgress = None):
+    if progress:
+        progress.proc = proc.proc
+    prefix = f'{revision}:'.encode()
+    try:
+        for line in proc.proc.stdout:
+            path, line_no, text = line.rstrip(b'\n').split(b'\0', 2)
+            yield GrepMatch(
+                    path.removeprefix(prefix).decode(errors='replace'),
+                    int(line_no),
+                    text[:MAX_GREP_LINE].decode(errors='replace')
+            )
+        try:
+            proc.wait()
+        except GitCommandError as ex:
+            # exit status 1 only means nothing matched
+            if ex.status != 1:
+                raise
+    finally:
+        if progress:
+            progress.proc = None
+        if proc.proc.poll() is None:
+            proc.proc.kill()
+            proc.proc.wait()
+
+class WorkTreeLocks:
+    ''' One lock per work tree, held by everything that may change it,
+    so GitRepos of the same path never run git there at once '''
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = Lock()
+
+    def get(self, path: str):
+        with self.lock:
+            return self.locks.setdefault(Path(path).resolve(), Lock())
+
+WORK_TREES = WorkTreeLocks()
 
 def ignore_git_command_error(func):
     try:
@@ -23,32 +423,68 @@ class GitRepo:
                  cmd_bits: SSHCmdBits):
         self.repo = Repo(repo.path)
         self.repo_url = get_repo_url(creds, repo.name)
-        self.ssh_cmd = get_ssh_cmd(cmd_bits, creds)
+        self.cmd_bits = cmd_bits
+        self.creds = creds
+        self.master = CONNECTIONS.get(cmd_bits, creds)
+        self.clone_mode = repo.clone_mode
 
     @classmethod
     def get(cls, repo: 'commit.Repo', creds: SSHCreds):
         return cls(repo, creds, SSHCmdBits.get())
 
+    def work_tree_lock(self):
+        return WORK_TREES.get(self.repo.working_dir)
+
     def head(self):
         if self.repo.head.is_valid():
             return self.repo.head.commit.hexsha
         else:
             return None
 
-    def revision_log(self, revision):
+    def revision_log(self, revision, **kw):
+        ''' Lazily walk Revisions reachable from revision,
+        see walk_revisions for paging and walk modes '''
         try:
             commit = self.repo.rev_parse(revision)
         except BadName:
-            return []
-        log = [commit, *list(commit.iter_parents())]
-        return map(lambda commit: (commit.hexsha, commit.summary), log)
+            return iter(())
+        return walk_revisions(self.repo.git, commit.hexsha, **kw)
 
     def local_changes(self):
         return map(lambda diff: diff.a_path, self.repo.index.diff(None))
 
-    def commit_stat(self, revision):
-        commit = self.repo.rev_parse(revision)
-        return list(commit.stats.files), commit.message
+    # diff against the first parent, root commits against the empty tree
+    DIFF_TREE_OPTS = ('-r', '--root', '--no-commit-id', '-z', '--diff-merges=first-parent')
+
+    def commit_hexsha(self, revision):
+        if len(revision) == 40 and all(char in hexdigits for char in revision):
+            return revision
+        return self.repo.rev_parse(revision).hexsha
+
+    def commit_files(self, revision):
+        ''' Return paths changed by the commit and its message '''
+        hexsha = self.commit_hexsha(revision)
+        def compute():
+            output = self.repo.git.diff_tree(
+                    *self.DIFF_TREE_OPTS, '--name-only', hexsha, strip_newline_in_stdout=False)
+            return [output.split('\0')[:-1], self.repo.commit(hexsha).message]
+        return COMMITS.get(self.repo.git_dir, 'files', hexsha, compute)
+
+    def commit_numstat(self, revision):
+        ''' Return {path: [added, deleted]} line counts, None for binary files '''
+        hexsha = self.commit_hexsha(revision)
+        def compute():
+            # partial clones fetch missing blobs here
+            with self.promisor_environment():
+                output = self.repo.git.diff_tree(
+                        *self.DIFF_TREE_OPTS, '--numstat', hexsha,
+                        strip_newline_in_stdout=False)
+            numstat = {}
+            for line in output.split('\0')[:-1]:
+                added, deleted, path = line.split('\t', 2)
+                numstat[path] = None if added == '-' else [int(added), int(deleted)]
+            return numstat
+        return COMMITS.get(self.repo.git_dir, 'numstat', hexsha, compute)
 
     def discard_local(self):
         ignore_git_command_error(lambda: self.repo.git.restore('--staged', '.'))
@@ -56,35 +492,240 @@ class GitRepo:
 
     def checkout(self, revision):
         self.discard_local()
-        self.repo.git.checkout(revision)
+        with self.promisor_environment():
+            self.repo.git.checkout(revision)
+
+    # plain first-parent patch regardless of user's diff config
+    PATCH_OPTS = (
+            '--format=', '--no-color', '--no-ext-diff', '--no-textconv', '--no-renames',
+            '--diff-merges=first-parent', '--src-prefix=a/', '--dst-prefix=b/'
+    )
+    MAX_PATCH_SIZE = 4 << 20
+
+    def spawn_patch(self, hexsha, *paths):
+        # unquoted non-ASCII paths in file headers
+        git = self.repo.git(c='core.quotePath=false')
+        with self.promisor_environment():
+            return git.show(*self.PATCH_OPTS, hexsha, '--', *paths, as_process=True)
+
+    def read_patch(self, hexsha, *paths, limit=None):
+        ''' Return patch of the commit, None if it is longer than limit bytes '''
+        proc = self.spawn_patch(hexsha, *paths)
+        try:
+            if limit is None:
+                buffer = proc.proc.stdout.read()
+            else:
+                buffer = proc.proc.stdout.read(limit + 1)
+                if len(buffer) > limit:
+                    return None
+            proc.wait()
+            return buffer
+        finally:
+            if proc.proc.poll() is None:
+                proc.proc.kill()
+                proc.proc.wait()
+
+    def commit_patch(self, revision):
+        ''' Return CommitPatch of the commit, built once per commit '''
+        hexsha = self.commit_hexsha(revision)
+        key = (self.repo.git_dir, hexsha)
+        patch = PATCHES.get(key)
+        if patch is None:
+            buffer = self.read_patch(hexsha, limit=self.MAX_PATCH_SIZE)
+            patch = CommitPatch(buffer)
+            PATCHES.put(key, patch)
+        return patch
 
     def diff(self, revision, file_path):
-        # cut first three lines (diff command, index hashes, blob filenames)
-        diff_lines = self.repo.git.show(
-                '--color=never', '--pretty=tformat:',
-                revision, file_path
-        ).split('\n', 5)
-        return diff_lines[-1]
-
-    def fetch(self):
+        patch = self.commit_patch(revision)
+        diff = None if patch.oversize else patch.file_diff(file_path)
+        if diff is None:
+            # huge commit, generate only the file's patch
+            buffer = self.read_patch(self.commit_hexsha(revision), file_path)
+            diff = CommitPatch(buffer).file_diff(file_path) or ''
+        return diff
+
+    def diff_chunks(self, revision, file_path):
+        ''' Lazily yield the file's diff without its header in text chunks '''
+        patch = self.commit_patch(revision)
+        if not patch.oversize and file_path in patch.offsets:
+            return patch.file_chunks(file_path)
+        # huge commit, stream only the file's patch
+        return read_file_diff(self.spawn_patch(self.commit_hexsha(revision), file_path))
+
+    def fetch(self, progress: GitProgress = None, incremental: bool = True):
+        ''' Fetch remote refs and make local branches match them.
+        Returns remote refs that were added, moved or removed '''
+        tips = self.remote_tips()
+        # transfer first, so cancelling it leaves local branches intact
+        with self.ssh_environment(), timed_transfer(self.master):
+            run_with_progress(self.repo.git, 'fetch', *self.fetch_targets(), '--prune',
+                              progress=progress)
+        new_tips = self.remote_tips()
+        if not incremental:
+            with self.promisor_environment():
+                self.recreate_branches()
+            changed = sorted(new_tips)
+        else:
+            changed = sorted(ref for ref in tips.keys() | new_tips.keys()
+                             if tips.get(ref) != new_tips.get(ref))
+            with self.promisor_environment():
+                self.update_branches(new_tips, changed)
+        if changed and HistoryIndex.exists(self.repo.git_dir):
+            # index is created by the first search, keep it current from then on
+            try:
+                self.update_history_index()
+            except sqlite3.Error:
+                LOGGER.warning('Failed to update history index of %s', self.repo.git_dir)
+        return changed
+
+    def fetch_targets(self):
+        ''' Single-branch clones fetch their branch from their own remote only '''
+        if self.clone_mode is CloneMode.SingleBranch:
+            return (self.remote(),)
+        return ('--all',)
+
+    def recreate_branches(self):
+        ''' Replace all local branches with tracking branches of remote refs '''
         self.discard_local()
         ignore_git_command_error(lambda: self.repo.git.checkout('HEAD', '--detach'))
         for branch in self.branches():
             self.repo.git.branch('-D', branch)
-        with self.repo.git.custom_environment(GIT_SSH_COMMAND=' '.join(self.ssh_cmd)):
-            self.repo.git.fetch('--all')
         for ref in self.refs():
             self.repo.git.checkout('--track', ref)
 
-    def push(self, ref):
-        with self.repo.git.custom_environment(GIT_SSH_COMMAND=' '.join(self.ssh_cmd)):
-            self.repo.git.push(ref.split('/'))
+    def update_branches(self, tips: dict[str, str], changed: list[str]):
+        ''' Point local branches at moved remote refs, add missing ones.
+        Working tree is only reset if the checked-out branch moved '''
+        remote = self.remote()
+        branches = set(self.branches())
+        current = self.current_branch()
+        for ref in changed:
+            branch = ref.removeprefix(f'{remote}/')
+            if ref not in tips:
+                if branch not in branches:
+                    continue
+                if branch == current:
+                    self.repo.git.checkout('--detach')
+                self.repo.git.branch('-D', branch)
+            elif branch == current:
+                self.discard_local()
+                self.repo.git.reset('--hard', ref)
+            else:
+                self.repo.git.branch('-f', '--track', branch, ref)
+        for ref in tips.keys() - set(changed):
+            branch = ref.removeprefix(f'{remote}/')
+            if branch not in branches:
+                self.repo.git.branch('--track', branch, ref)
+
+    def remote_tips(self):
+        ''' Return {remote ref: hexsha} of remote-tracking branches '''
+        prefix = f'refs/remotes/{self.remote()}/'
+        output = self.repo.git.for_each_ref('--format=%(objectname) %(refname)', prefix)
+        tips = {}
+        for line in output.splitlines():
+            hexsha, ref = line.split(' ', 1)
+            if ref != f'{prefix}HEAD':
+                tips[ref.removeprefix('refs/remotes/')] = hexsha
+        return tips
+
+    def current_branch(self):
+        ''' Checked-out branch name, None if HEAD is detached '''
+        head = self.repo.head
+        return None if head.is_detached else head.reference.name
+
+    def is_shallow(self):
+        ''' Whether a shallow clone still misses older history '''
+        return (self.clone_mode is CloneMode.Shallow
+                and Path(self.repo.git_dir, 'shallow').exists())
+
+    def deepen(self, depth: int = None, progress: GitProgress = None):
+        ''' Fetch depth more commits of shallow history '''
+        depth = depth or GitCloner.DEFAULT_DEPTH
+        with self.ssh_environment(), timed_transfer(self.master):
+            run_with_progress(
+                    self.repo.git, 'fetch', f'--deepen={depth}', progress=progress)
+
+    def deepen_log(self, revision, skip: int, progress: GitProgress = None):
+        ''' Deepen shallow history and continue revision log after skip commits,
+        None if history is complete '''
+        if not self.is_shallow():
+            return None
+        self.deepen(progress=progress)
+        return self.revision_log(revision, skip=skip)
+
+    def is_partial(self):
+        ''' Whether blobs are downloaded on demand '''
+        return self.clone_mode is CloneMode.Partial
+
+    HISTORY_BATCH = 200
+
+    def update_history_index(self, progress: GitProgress = None):
+        ''' Index commits of all refs that are not indexed yet, returns their number.
+        Partial clones index only messages and paths '''
+        revisions = self.repo.git.rev_list('--all').split()
+        with HistoryIndex(self.repo.git_dir) as index:
+            new = index.missing(revisions)
+            batch = []
+            commits = walk_patches(self.repo.git, new, not self.is_partial(), progress)
+            for count, commit in enumerate(commits, 1):
+                batch.append(commit)
+                if len(batch) == self.HISTORY_BATCH:
+                    # interrupted indexing keeps finished batches
+                    index.add(batch)
+                    batch = []
+                    if progress and progress.callback:
+                        progress.callback(count, len(new), 'Indexing history')
+            index.add(batch)
+        return len(new)
+
+    def search_history(self, name: str, text: str, limit: int, progress: GitProgress = None):
+        ''' Return newest HistoryMatches of text, the index is built or updated first '''
+        self.update_history_index(progress)
+        with HistoryIndex(self.repo.git_dir) as index:
+            return index.search(name, text, limit)
+
+    def grep(self,
+             pattern: str,
+             revision: str,
+             max_count: int,
+             regex: bool = False,
+             ignore_case: bool = False,
+             progress: GitProgress = None):
+        ''' Lazily search files of revision for pattern, working tree is not used.
+        Returns None if the repo has no such revision '''
+        try:
+            self.repo.git.rev_parse('--verify', '-q', f'{revision}^{{tree}}')
+        except GitCommandError:
+            return None
+        # partial clones download searched blobs
+        with self.promisor_environment():
+            matches = walk_grep(self.repo.git, pattern, revision, regex, ignore_case, progress)
+            return islice(matches, max_count)
+
+    def push(self, ref, progress: GitProgress = None):
+        with self.ssh_environment(), timed_transfer(self.master):
+            run_with_progress(self.repo.git, 'push', *ref.split('/'), progress=progress)
+
+    def ssh_environment(self):
+        ''' ssh for network transfers, through the session's master '''
+        if self.master:
+            self.master.connect()
+        ssh_cmd = get_ssh_cmd(self.cmd_bits, self.creds, self.master)
+        return self.repo.git.custom_environment(GIT_SSH_COMMAND=' '.join(ssh_cmd))
+
+    def promisor_environment(self):
+        ''' ssh for blobs a partial clone fetches on demand during local
+        commands. Never touches the master, so the commands stay offline
+        unless git really needs the server '''
+        ssh_cmd = get_ssh_cmd(self.cmd_bits, self.creds)
+        return self.repo.git.custom_environment(GIT_SSH_COMMAND=' '.join(ssh_cmd))
 
     def branches(self):
         return [branch.name for branch in self.repo.branches]
 
     def refs(self):
-        return [ref.name for ref in self.repo.remote().refs]
+        return [ref.name for ref in self.repo.remote().refs if ref.remote_head != 'HEAD']
 
     def remote(self):
         return self.repo.remote().name
@@ -93,17 +734,43 @@ class GitCloner:
     def __init__(self,
                  cmd_bits: SSHCmdBits,
                  creds: SSHCreds):
-        self.ssh_cmd = ' '.join(get_ssh_cmd(cmd_bits, creds))
+        self.cmd_bits = cmd_bits
         self.creds = creds
+        self.master = CONNECTIONS.get(cmd_bits, creds)
 
     @classmethod
     def get(cls, creds: SSHCreds):
         return cls(SSHCmdBits.get(), creds)
 
-    def clone(self, repo: 'commit.Repo'):
+    DEFAULT_DEPTH = 50
+
+    @staticmethod
+    def mode_options(mode: CloneMode, depth: int):
+        match mode:
+            case CloneMode.Full:
+                return ()
+            case CloneMode.Partial:
+                return ('--filter=blob:none',)
+            case CloneMode.Shallow:
+                # --depth implies --single-branch
+                return (f'--depth={depth}', '--no-single-branch')
+            case CloneMode.SingleBranch:
+                return ('--single-branch',)
+            case mode:
+                raise NotImplementedError(f'Unsupported clone mode: {mode}')
+
+    def clone(self,
+              repo: 'commit.Repo',
+              progress: GitProgress = None,
+              mode: CloneMode = CloneMode.Full,
+              depth: int = DEFAULT_DEPTH):
         repo_url = get_repo_url(self.creds, repo.name)
-        Repo.clone_from(
-                repo_url,
-                repo.path,
-                env=dict(GIT_SSH_COMMAND=self.ssh_cmd)
-        )
+        if self.master:
+            self.master.connect()
+        ssh_cmd = ' '.join(get_ssh_cmd(self.cmd_bits, self.creds, self.master))
+        with timed_transfer(self.master):
+            run_with_progress(
+                    Git(), 'clone', *self.mode_options(mode, depth), repo_url, str(repo.path),
+                    progress=progress,
+                    env=dict(GIT_SSH_COMMAND=ssh_cmd)
+            )
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from pathlib import Path
+import sqlite3
+
+@dataclass(frozen=True)
+class HistoryMatch:
+    ''' Commit found by a history search, path is None for message matches '''
+    repo: str
+    hexsha: str
+    summary: str
+    author_time: int
+    path: str
+    snippet: str
+
+def fts_query(text: str):
+    ''' FTS5 query matching rows that contain all words of text '''
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+class HistoryIndex:
+    ''' Full-text index of commit messages, changed paths and added or
+    removed diff lines, kept in an SQLite FTS5 file inside the repo's git dir '''
+    STORE_NAME = 'config_sync_history.sqlite3'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS commits(
+            id INTEGER PRIMARY KEY,
+            hexsha TEXT NOT NULL UNIQUE,
+            author_time INTEGER NOT NULL,
+            summary TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(message);
+        CREATE VIRTUAL TABLE IF NOT EXISTS changes USING fts5(
+            path, lines, commit_id UNINDEXED
+        );
+    '''
+    SNIPPET_WORDS = 12
+
+    def __init__(self, git_dir: str):
+        self.path = Path(git_dir) / self.STORE_NAME
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.db.executescript(self.SCHEMA)
+
+    @classmethod
+    def exists(cls, git_dir: str):
+        return (Path(git_dir) / cls.STORE_NAME).exists()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def missing(self, revisions: list[str]):
+        ''' Return revisions that are not indexed yet, in the given order '''
+        indexed = {row[0] for row in self.db.execute('SELECT hexsha FROM commits')}
+        return [hexsha for hexsha in revisions if hexsha not in indexed]
+
+    def add(self, commits: 'list[api.git.PatchedCommit]'):
+        ''' Index commits in one transaction, already indexed ones are skipped '''
+        if not commits:
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            for commit in commits:
+                cursor = self.db.execute(
+                        'INSERT OR IGNORE INTO commits(hexsha, author_time, summary) '
+                        'VALUES (?, ?, ?)',
+                        (commit.hexsha, commit.author_time, commit.message.split('\n', 1)[0]))
+                if not cursor.rowcount:
+                    # indexed meanwhile by another update
+                    continue
+                commit_id = cursor.lastrowid
+                self.db.execute(
+                        'INSERT INTO messages(rowid, message) VALUES (?, ?)',
+                        (commit_id, commit.message))
+                self.db.executemany(
+                        'INSERT INTO changes(path, lines, commit_id) VALUES (?, ?, ?)',
+                        ((path, lines, commit_id) for path, lines in commit.files.items()))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def search(self, repo: str, text: str, limit: int):
+        ''' Return newest matches of all words of text, a file match needs
+        all words in its path and diff lines '''
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self.db.execute(f'''
+                SELECT hexsha, summary, author_time, NULL,
+                       snippet(messages, 0, '', '', '...', {self.SNIPPET_WORDS})
+                FROM messages JOIN commits ON commits.id = messages.rowid
+                WHERE messages MATCH :query
+                UNION ALL
+                SELECT hexsha, summary, author_time, path,
+                       snippet(changes, 1, '', '', '...', {self.SNIPPET_WORDS})
+                FROM changes JOIN commits ON commits.id = changes.commit_id
+                WHERE changes MATCH :query
+                ORDER BY author_time DESC
+                LIMIT :limit
+                ''', {'query': query, 'limit': limit})
+        return [HistoryMatch(repo, *row) for row in rows]
@@ -1,7 +1,18 @@
-from dataclasses import dataclass
+from asyncio import Semaphore, create_subprocess_exec, get_running_loop, to_thread
+from dataclasses import dataclass, field
+from logging import getLogger
 from os import environ
+from os.path import join
 from platform import system
-from subprocess import run
+from shutil import rmtree
+from subprocess import run, CompletedProcess, Popen, DEVNULL, PIPE
+from tempfile import mkdtemp
+from threading import Lock
+from time import perf_counter
+from typing import ClassVar
+from weakref import WeakKeyDictionary
+
+LOGGER = getLogger(__file__)
 
 @dataclass(frozen=True)
 class SSHCreds:
@@ -13,11 +24,16 @@ class SSHCreds:
     def change_password(self, password: str):
         return SSHCreds(self.login, password, self.host, self.port)
 
+    @property
+    def destination(self):
+        return f'{self.login}@{self.host}'
+
 @dataclass(frozen=True)
 class SSHCmdBits:
     passwd_pipe: tuple[str]
     ssh_opts: tuple[str]
     port_arg: str
+    multiplexing: bool = False
 
     @classmethod
     def get(cls):
@@ -35,7 +51,8 @@ class SSHCmdBits:
                 ('sshpass', '-p'),
                 ('ssh', '-q', '-o', 'StrictHostKeyChecking=no', \
                               '-o', 'UserKnownHostsFile=/dev/null'),
-                '-p'
+                '-p',
+                multiplexing=True
         )
 
     @staticmethod
@@ -46,20 +63,241 @@ class SSHCmdBits:
                 '-P'
         )
 
+@dataclass
+class SSHTimings:
+    ''' Time spent on connection setup versus commands run over it '''
+    handshakes: int = 0
+    handshake_time: float = 0.0
+    commands: int = 0
+    command_time: float = 0.0
+
+    def __str__(self):
+        return f'{self.handshakes} handshake(s) in {self.handshake_time:.3f}s, ' \
+               f'{self.commands} command(s) in {self.command_time:.3f}s'
+
+class SSHMaster:
+    ''' OpenSSH control master shared by all commands run with the same creds.
+    Opened by the first remote command, commands connect directly while it is down '''
+    # seconds before opening a failed master is tried again
+    RETRY_INTERVAL: ClassVar[float] = 30.0
+
+    def __init__(self, cmd_bits: SSHCmdBits, creds: SSHCreds):
+        self.cmd_bits = cmd_bits
+        self.creds = creds
+        self.timings = SSHTimings()
+        self.control_dir = None
+        self.is_open = False
+        # perf_counter() time before which a failed master is not reopened
+        self.retry_at = 0.0
+        # guards the state, open_lock only serializes handshakes
+        self.lock = Lock()
+        self.open_lock = Lock()
+
+    @property
+    def control_path(self):
+        return join(self.control_dir, 'master')
+
+    def options(self):
+        ''' Options that route ssh through the master, empty until it is open '''
+        with self.lock:
+            if not self.is_open:
+                return ()
+            return ('-o', f'ControlPath={self.control_path}',
+                    '-o', 'ControlMaster=no')
+
+    def connect(self):
+        ''' Open the master for a remote command about to run, returns options() '''
+        with self.open_lock:
+            with self.lock:
+                should_open = not self.is_open and perf_counter() >= self.retry_at
+            if should_open:
+                self._open()
+        return self.options()
+
+    def _open(self):
+        with self.lock:
+            if self.control_dir is None:
+                self.control_dir = mkdtemp(prefix='config_sync_')
+            control_path = self.control_path
+        command = (
+                *self.cmd_bits.passwd_pipe, self.creds.password,
+                *self.cmd_bits.ssh_opts,
+                '-o', f'ControlPath={control_path}',
+                '-o', 'ControlMaster=yes',
+                '-o', 'ControlPersist=yes',
+                '-f', '-N',
+                self.cmd_bits.port_arg, str(self.creds.port),
+                self.creds.destination
+        )
+        start = perf_counter()
+        try:
+            res = run(command, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+            is_open = not res.returncode
+        except OSError:
+            # e.g. sshpass is not installed
+            is_open = False
+        with self.lock:
+            self.timings.handshakes += 1
+            self.timings.handshake_time += perf_counter() - start
+            self.is_open = is_open
+            self.retry_at = 0.0 if is_open else perf_counter() + self.RETRY_INTERVAL
+        if not is_open:
+            LOGGER.warning('Failed to open SSH master for %s', self.creds.destination)
+
+    def add_command_time(self, elapsed: float):
+        with self.lock:
+            self.timings.commands += 1
+            self.timings.command_time += elapsed
+
+    def close(self):
+        with self.open_lock, self.lock:
+            if self.is_open:
+                run((self.cmd_bits.ssh_opts[0],
+                     '-o', f'ControlPath={self.control_path}',
+                     '-O', 'exit', self.creds.destination),
+                    stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+                self.is_open = False
+            if self.control_dir is not None:
+                rmtree(self.control_dir, ignore_errors=True)
+                self.control_dir = None
+        LOGGER.info('SSH session %s: %s', self.creds.destination, self.timings)
+
+class SSHConnections:
+    ''' Per-session registry of SSH masters keyed by creds '''
+
+    def __init__(self):
+        self.masters = {}
+        # AsyncSSH of each SSH, so its limit holds across packages
+        self.transports = {}
+        self.lock = Lock()
+
+    def get(self, cmd_bits: SSHCmdBits, creds: SSHCreds):
+        if not cmd_bits.multiplexing:
+            return None
+        with self.lock:
+            master = self.masters.get(creds)
+            if master is None:
+                master = self.masters[creds] = SSHMaster(cmd_bits, creds)
+            return master
+
+    def transport(self, ssh: 'SSH'):
+        ''' Asyncio transport shared by all packages using ssh '''
+        with self.lock:
+            transport = self.transports.get(ssh)
+            if transport is None:
+                transport = self.transports[ssh] = AsyncSSH(ssh)
+            return transport
+
+    def close(self, creds: SSHCreds):
+        with self.lock:
+            master = self.masters.pop(creds, None)
+            self.transports = {ssh: transport for ssh, transport in self.transports.items()
+                               if ssh.creds != creds}
+        if master:
+            master.close()
+
+    def close_all(self):
+        with self.lock:
+            masters = list(self.masters.values())
+            self.masters.clear()
+            self.transports.clear()
+        for master in masters:
+            master.close()
+
+    def timings(self):
+        with self.lock:
+            return {creds: master.timings for creds, master in self.masters.items()}
+
+CONNECTIONS = SSHConnections()
+
 @dataclass(frozen=True)
 class SSH:
     cmd_bits: SSHCmdBits
     creds: SSHCreds
+    master: SSHMaster = field(default=None, compare=False)
 
-    def run(self, *command, input: bytes=None):
-        command = (
+    CHUNK_SIZE: ClassVar[int] = 64 * 1024
+
+    def connect(self):
+        ''' Open the master, if any, before a remote command runs '''
+        if self.master:
+            self.master.connect()
+
+    def command(self, *command):
+        mux_opts = self.master.options() if self.master else ()
+        return (
                 *self.cmd_bits.passwd_pipe, self.creds.password,
-                *self.cmd_bits.ssh_opts,
+                *self.cmd_bits.ssh_opts, *mux_opts,
                 self.cmd_bits.port_arg, str(self.creds.port),
-                f'{self.creds.login}@{self.creds.host}', *command
+                self.creds.destination, *command
         )
-        return run(command, capture_output=True, input=input)
+
+    def run(self, *command, input: bytes=None):
+        self.connect()
+        command = self.command(*command)
+        start = perf_counter()
+        res = run(command, capture_output=True, input=input)
+        if self.master:
+            self.master.add_command_time(perf_counter() - start)
+        return res
+
+    def stream(self, *command):
+        ''' Yield command's stdout in chunks as they arrive,
+        return CompletedProcess without stdout when it exits '''
+        self.connect()
+        command = self.command(*command)
+        start = perf_counter()
+        with Popen(command, stdin=DEVNULL, stdout=PIPE, stderr=PIPE) as proc:
+            while chunk := proc.stdout.read1(self.CHUNK_SIZE):
+                yield chunk
+            stderr = proc.stderr.read()
+            returncode = proc.wait()
+        if self.master:
+            self.master.add_command_time(perf_counter() - start)
+        return CompletedProcess(command, returncode, b'', stderr)
+
+    @classmethod
+    def get(cls, creds: SSHCreds):
+        cmd_bits = SSHCmdBits.get()
+        return cls(cmd_bits, creds, CONNECTIONS.get(cmd_bits, creds))
+
+@dataclass(frozen=True)
+class AsyncSSH:
+    ''' SSH transport for asyncio, runs at most `limit` commands at once '''
+    MAX_CONCURRENT: ClassVar[int] = 4
+
+    ssh: SSH
+    limit: int = MAX_CONCURRENT
+    semaphores: WeakKeyDictionary = field(default_factory=WeakKeyDictionary, compare=False)
+
+    @property
+    def creds(self):
+        return self.ssh.creds
+
+    def semaphore(self):
+        # semaphores cannot be shared between event loops
+        loop = get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores[loop] = Semaphore(self.limit)
+        return self.semaphores[loop]
+
+    async def run(self, *command, input: bytes=None):
+        async with self.semaphore():
+            # opening the master blocks until the handshake is done
+            await to_thread(self.ssh.connect)
+            command = self.ssh.command(*command)
+            start = perf_counter()
+            proc = await create_subprocess_exec(
+                    *command,
+                    stdin=DEVNULL if input is None else PIPE,
+                    stdout=PIPE,
+                    stderr=PIPE
+            )
+            stdout, stderr = await proc.communicate(input)
+        if self.ssh.master:
+            self.ssh.master.add_command_time(perf_counter() - start)
+        return CompletedProcess(command, proc.returncode, stdout, stderr)
 
     @classmethod
     def get(cls, creds: SSHCreds):
-        return cls(SSHCmdBits.get(), creds)
+        return CONNECTIONS.transport(SSH.get(creds))
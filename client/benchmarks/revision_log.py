@@ -0,0 +1,74 @@
+''' Compare commit log readers on a synthetic repository.
+
+Run from the client directory:
+    python -m benchmarks.revision_log [commit count]
+'''
+from itertools import islice
+from pathlib import Path
+from subprocess import PIPE, Popen, run
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from git import Repo
+
+from api.git import walk_revisions
+
+DEFAULT_COMMITS = 100_000
+PAGE_SIZE = 500
+
+def fast_import_stream(count: int):
+    ''' Linear history, every commit changes one of a hundred files '''
+    for idx in range(count):
+        message = f'Change {idx}: update file {idx % 100}'.encode()
+        content = f'{idx}\n'.encode()
+        yield b'commit refs/heads/master\n'
+        yield f'committer Bench <bench@example.com> {1_600_000_000 + idx} +0000\n'.encode()
+        yield b'data %d\n%s\n' % (len(message), message)
+        yield b'M 644 inline file%d.txt\n' % (idx % 100)
+        yield b'data %d\n%s\n' % (len(content), content)
+
+def make_repo(path: Path, count: int):
+    run(['git', 'init', '-q', '-b', 'master', path], check=True)
+    proc = Popen(['git', 'fast-import', '--quiet'], cwd=path, stdin=PIPE)
+    proc.stdin.writelines(fast_import_stream(count))
+    proc.stdin.close()
+    if proc.wait():
+        raise RuntimeError('git fast-import failed')
+    return Repo(path)
+
+def gitpython_parents(repo: Repo):
+    ''' Former revision_log: a Commit object for every ancestor '''
+    commit = repo.rev_parse('master')
+    log = [commit, *list(commit.iter_parents())]
+    return map(lambda commit: (commit.hexsha, commit.summary), log)
+
+def gitpython_iter(repo: Repo):
+    return ((commit.hexsha, commit.summary) for commit in repo.iter_commits('master'))
+
+def walker(repo: Repo):
+    return walk_revisions(repo.git, 'master')
+
+def timed(func):
+    start = perf_counter()
+    result = func()
+    return perf_counter() - start, result
+
+def main():
+    count = int(argv[1]) if len(argv) > 1 else DEFAULT_COMMITS
+    with TemporaryDirectory() as tmp:
+        elapsed, repo = timed(lambda: make_repo(Path(tmp), count))
+        print(f'{count} commits created in {elapsed:.2f}s')
+        print(f'{"reader":<20}{"first page":>12}{"full log":>12}')
+        for name, reader in (
+                ('GitPython parents', gitpython_parents),
+                ('GitPython iter', gitpython_iter),
+                ('walk_revisions', walker)):
+            first, _ = timed(lambda: list(islice(reader(repo), PAGE_SIZE)))
+            full, log = timed(lambda: sum(1 for _ in reader(repo)))
+            assert log == count, f'{name} listed {log} commits'
+            print(f'{name:<20}{first:>11.3f}s{full:>11.3f}s')
+        repo.close()
+
+if __name__ == '__main__':
+    main()
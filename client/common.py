@@ -1,11 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
-@dataclass(frozen=True)
-class Repo:
-    name: str
-    path: 'Path'
-
 class Role(Enum):
     User = 'user'
     Admin = 'admin'
@@ -14,5 +9,18 @@ class Role(Enum):
     def is_admin(self):
         return self != self.User
 
+class CloneMode(Enum):
+    Full = 'full'
+    Partial = 'partial' # blobs are fetched on demand
+    Shallow = 'shallow' # history is deepened on demand
+    SingleBranch = 'single-branch'
+
+@dataclass(frozen=True)
+class Repo:
+    name: str
+    path: 'Path'
+    # how the repo was cloned, kept by ConfigManager
+    clone_mode: CloneMode = field(default=CloneMode.Full, compare=False)
+
 def bullet_list(items: list[str]):
     return '\n'.join((f'  - {item}' for item in items))
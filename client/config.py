@@ -1,12 +1,18 @@
 from logging import getLogger
+from contextlib import contextmanager
 from copy import deepcopy
 from dataclasses import dataclass, field
 from functools import wraps
-from itertools import starmap
+from os import fsync, replace, stat
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
 from typing import ClassVar, TypedDict
+import sqlite3
 
+from api.commands.cache import CommandCache
 from api.ssh import SSHCreds
-from common import Repo
+from common import CloneMode, Repo
 
 import tomlkit
 from PySide6.QtCore import QReadWriteLock
@@ -17,12 +23,192 @@ UserConfig = TypedDict('UserConfig', {'login': str, 'host': str, 'port': int})
 RepoConfig = dict[str, str]
 Config = TypedDict('Config', {'user': UserConfig, 'repos': RepoConfig})
 
-@dataclass(frozen=True)
-class ConfigManager:
+class TomlStore:
+    ''' Parsed TOML config kept in memory, reloaded when the file changes '''
     DEFAULT_CONFIG: ClassVar[Config] = {'repos': {}}
 
+    def __init__(self, path: Path):
+        self.path = path
+        self.config = None
+        self.file_stat = None
+        self.dirty = False
+        self.deferred = 0
+        self.lock = Lock()
+
+    def _stat(self):
+        try:
+            file_stat = stat(self.path)
+        except OSError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def _current(self):
+        ''' Return parsed config, reparse if someone else changed the file '''
+        with self.lock:
+            if self.dirty:
+                # unsaved changes win over the file
+                return self.config
+            file_stat = self._stat()
+            if self.config is None or file_stat != self.file_stat:
+                self._load(file_stat)
+            return self.config
+
+    def _load(self, file_stat):
+        try:
+            with open(self.path) as file:
+                self.config = tomlkit.load(file)
+            self.file_stat = file_stat
+        except OSError:
+            LOGGER.warning('Failed to read config: %s', self.path)
+            self.config = tomlkit.document()
+            self.config.update(deepcopy(self.DEFAULT_CONFIG))
+            self.dirty = True
+            self._flush()
+        if 'repos' not in self.config:
+            self.config['repos'] = {}
+
+    def _changed(self):
+        with self.lock:
+            self.dirty = True
+            if not self.deferred:
+                self._flush()
+
+    def _flush(self):
+        ''' Write config to a temp file and rename it over the old one '''
+        if not self.dirty:
+            return
+        try:
+            with NamedTemporaryFile(
+                    'w', dir=self.path.parent, prefix=f'.{self.path.name}.',
+                    delete=False) as file:
+                tomlkit.dump(self.config, file)
+                file.flush()
+                fsync(file.fileno())
+            replace(file.name, self.path)
+        except OSError:
+            LOGGER.warning('Failed to write to config: %s', self.path)
+            return
+        self.dirty = False
+        self.file_stat = self._stat()
+
+    def begin(self):
+        with self.lock:
+            self.deferred += 1
+
+    def end(self):
+        with self.lock:
+            self.deferred -= 1
+            if not self.deferred:
+                self._flush()
+
+    def get_section(self, section: str):
+        return dict(self._current().get(section, {}))
+
+    def set_section(self, section: str, values: dict):
+        self._current()[section] = values
+        self._changed()
+
+    def get_repos(self):
+        return {name: str(path) for name, path in self._current()['repos'].items()}
+
+    def add_repo(self, name: str, path: str):
+        self._current()['repos'][name] = path
+        self._changed()
+
+    def delete_repos(self, names: 'Iterable[str]'):
+        repos = self._current()['repos']
+        for name in names:
+            if name in repos:
+                del repos[name]
+        self._changed()
+
+class SQLiteStore:
+    ''' Config in an indexed SQLite database, for many tracked repos '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS repos(
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS settings(
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value,
+            PRIMARY KEY (section, key)
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.deferred = 0
+        self.lock = Lock()
+        # autocommit, batches are explicit transactions
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+
+    def _execute(self, sql: str, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _executemany(self, sql: str, params: 'Iterable'):
+        with self.lock:
+            self.db.executemany(sql, params)
+
+    def begin(self):
+        with self.lock:
+            if not self.deferred:
+                self.db.execute('BEGIN')
+            self.deferred += 1
+
+    def end(self):
+        with self.lock:
+            self.deferred -= 1
+            if not self.deferred:
+                self.db.execute('COMMIT')
+
+    def get_section(self, section: str):
+        return dict(self._execute(
+                'SELECT key, value FROM settings WHERE section = ?', (section,)))
+
+    def set_section(self, section: str, values: dict):
+        with self.lock:
+            self.db.execute('SAVEPOINT section')
+            self.db.execute('DELETE FROM settings WHERE section = ?', (section,))
+            self.db.executemany(
+                    'INSERT INTO settings VALUES (?, ?, ?)',
+                    ((section, key, value) for key, value in values.items()))
+            self.db.execute('RELEASE section')
+
+    def get_repos(self):
+        return dict(self._execute('SELECT name, path FROM repos ORDER BY name'))
+
+    def add_repo(self, name: str, path: str):
+        self._execute('INSERT OR REPLACE INTO repos VALUES (?, ?)', (name, path))
+
+    def delete_repos(self, names: 'Iterable[str]'):
+        self._executemany('DELETE FROM repos WHERE name = ?', ((name,) for name in names))
+
+def open_store(path: Path):
+    ''' Pick config backend by file suffix '''
+    if path.suffix in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteStore(path)
+    return TomlStore(path)
+
+@dataclass(frozen=True)
+class ConfigManager:
     config_path: 'Path'
     config_lock: QReadWriteLock = field(default_factory=QReadWriteLock)
+    store: 'TomlStore | SQLiteStore' = field(init=False, repr=False, compare=False)
+
+    FETCH_CONCURRENCY: ClassVar[int] = 4
+    CLONE_CONCURRENCY: ClassVar[int] = 4
+    SEARCH_CONCURRENCY: ClassVar[int] = 4
+    GREP_MAX_MATCHES: ClassVar[int] = 1000
+    GREP_TIMEOUT: ClassVar[float] = 30.0
+    DIFF_MAX_LINES: ClassVar[int] = 20000
+    DIFF_MEMORY: ClassVar[int] = 16 << 20
+
+    def __post_init__(self):
+        object.__setattr__(self, 'store', open_store(Path(self.config_path)))
 
     @staticmethod
     def read_lock(method):
@@ -46,28 +232,23 @@ class ConfigManager:
                 self.config_lock.unlock()
         return inner
 
-    def _load(self):
+    @contextmanager
+    def batch(self):
+        ''' Save all changes made inside at once on exit '''
+        self.store.begin()
         try:
-            with open(self.config_path) as file:
-                return tomlkit.load(file)
-        except OSError:
-            LOGGER.warning('Failed to read config: %s', self.config_path)
-            config = deepcopy(ConfigManager.DEFAULT_CONFIG)
-            self._save(config)
-            return config
-
-    def _save(self, config: Config):
-        try:
-            with open(self.config_path, 'w') as file:
-                return tomlkit.dump(config, file)
-        except OSError:
-            LOGGER.warning('Failed to write to config: %s', self.config_path)
-
+            yield self
+        finally:
+            self.config_lock.lockForWrite()
+            try:
+                self.store.end()
+            finally:
+                self.config_lock.unlock()
 
     @read_lock
     def get_last_creds(self) -> SSHCreds:
         ''' Returns SSHCreds from config without password '''
-        config = self._load().get('user', {})
+        config = self.store.get_section('user')
         return SSHCreds(
                 config.get('login', None),
                 None,
@@ -78,30 +259,86 @@ class ConfigManager:
     @write_lock
     def save_creds(self, creds: SSHCreds):
         ''' Save creds without password '''
-        config = self._load()
-        config['user'] = {
+        self.store.set_section('user', {
                 'login': creds.login,
                 'host': creds.host,
                 'port': creds.port
-        }
-        self._save(config)
+        })
+
+    @read_lock
+    def get_cache_ttl(self) -> float:
+        ''' Seconds for which server query results are reused '''
+        config = self.store.get_section('cache')
+        return float(config.get('ttl', CommandCache.DEFAULT_TTL))
+
+    @read_lock
+    def get_commit_cache(self) -> bool:
+        ''' Whether commit file lists and stats are also stored inside repos '''
+        config = self.store.get_section('cache')
+        return bool(config.get('commits', True))
+
+    @read_lock
+    def get_fetch_concurrency(self) -> int:
+        ''' Number of repos fetched at once by Fetch All '''
+        config = self.store.get_section('fetch')
+        return max(1, int(config.get('concurrency', self.FETCH_CONCURRENCY)))
+
+    @read_lock
+    def get_clone_concurrency(self) -> int:
+        ''' Number of repos cloned at once '''
+        config = self.store.get_section('clone')
+        return max(1, int(config.get('concurrency', self.CLONE_CONCURRENCY)))
+
+    @read_lock
+    def get_search_concurrency(self) -> int:
+        ''' Number of repos searched at once '''
+        config = self.store.get_section('search')
+        return max(1, int(config.get('concurrency', self.SEARCH_CONCURRENCY)))
+
+    @read_lock
+    def get_grep_max_matches(self) -> int:
+        ''' Matches after which Grep All stops '''
+        config = self.store.get_section('grep')
+        return max(1, int(config.get('max_matches', self.GREP_MAX_MATCHES)))
+
+    @read_lock
+    def get_grep_timeout(self) -> float:
+        ''' Seconds after which Grep All stops '''
+        config = self.store.get_section('grep')
+        return float(config.get('timeout', self.GREP_TIMEOUT))
+
+    @read_lock
+    def get_diff_max_lines(self) -> int:
+        ''' Changed lines of a file above which its diff loads only on request '''
+        config = self.store.get_section('diff')
+        return max(1, int(config.get('max_lines', self.DIFF_MAX_LINES)))
+
+    @read_lock
+    def get_diff_memory(self) -> int:
+        ''' Bytes of diff text kept in the viewer, earlier text is released '''
+        config = self.store.get_section('diff')
+        return max(1 << 20, int(config.get('memory', self.DIFF_MEMORY)))
 
     @read_lock
     def get_repos(self) -> list[Repo]:
-        config = self._load()['repos']
-        return list(starmap(Repo, config.items()))
+        modes = self.store.get_section('clone_modes')
+        return [Repo(name, path, CloneMode(modes.get(name, CloneMode.Full.value)))
+                for name, path in self.store.get_repos().items()]
 
     @write_lock
     def add_repo(self, repo: Repo):
-        config = self._load()
-        config['repos'][repo.name] = str(repo.path)
-        self._save(config)
-    
+        self.store.add_repo(repo.name, str(repo.path))
+
     @write_lock
     def delete_repos(self, repo_names: list[str]):
-        config = self._load()
-        repos = config['repos']
-        for repo_name in repo_names:
-            if repo_name in repos:
-                del repos[repo_name]
-        self._save(config)
+        self.store.delete_repos(repo_names)
+        modes = self.store.get_section('clone_modes')
+        if modes.keys() & set(repo_names):
+            self.store.set_section('clone_modes', {
+                    name: mode for name, mode in modes.items() if name not in repo_names})
+
+    @write_lock
+    def set_clone_mode(self, repo_name: str, mode: CloneMode):
+        modes = self.store.get_section('clone_modes')
+        modes[repo_name] = mode.value
+        self.store.set_section('clone_modes', modes)
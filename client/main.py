@@ -1,17 +1,24 @@
+import logging
+import os
 import sys
 
 from PySide6.QtWidgets import QApplication, QMainWindow
 
+from api.ssh import CONNECTIONS
 from config import ConfigManager
 from ui_ctrl.login import LoginController
 from ui_ctrl.main import MainController
 from ui import Ui_MainWindow
 
+# config file path, a .db/.sqlite/.sqlite3 suffix selects the SQLite store
+CONFIG_PATH_VAR = 'CONFIG_SYNC_CONFIG'
+DEFAULT_CONFIG_PATH = 'conf.toml'
+
 class Application(QApplication):
-    def __init__(self, argv):
+    def __init__(self, argv, config_path: str = DEFAULT_CONFIG_PATH):
         super().__init__(argv)
         self.window = QMainWindow()
-        self.config = ConfigManager('conf.toml')
+        self.config = ConfigManager(config_path)
 
         self.login = LoginController(self.config)
         self.login.signals.logged_in.connect(self.on_login)
@@ -24,15 +31,20 @@ class Application(QApplication):
 
     def on_logout(self):
         self.main.signals.logged_out.disconnect(self.on_logout)
+        self.main.close()
         del self.main
         self.login.init_ui(self.window)
 
     def run(self):
         self.window.show()
-        return self.exec()
+        try:
+            return self.exec()
+        finally:
+            CONNECTIONS.close_all()
 
 if __name__ == '__main__':
-    app = Application(sys.argv)
+    logging.basicConfig(level=logging.INFO)
+    app = Application(sys.argv, os.environ.get(CONFIG_PATH_VAR, DEFAULT_CONFIG_PATH))
     if len(sys.argv) > 1:
         app.login.ui.password.setText(sys.argv[1])
         app.login.ui.login_button.click()
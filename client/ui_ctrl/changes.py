@@ -2,8 +2,12 @@ from dataclasses import dataclass, field
 from functools import partial
 from typing import ClassVar
 
-from PySide6.QtCore import QObject, Qt, QPoint, Signal, Slot
-from PySide6.QtWidgets import QMenu, QMessageBox, QTableWidgetItem, QHeaderView
+from PySide6.QtCore import QItemSelection, QModelIndex, QObject, Qt, QPoint, Signal, Slot
+from PySide6.QtWidgets import QMenu, QMessageBox, QHeaderView
+
+from .commits import CommitTableModel
+from .errors import error_handler
+from .search import FilterProxyModel
 
 class ChangeController:
     class Signals(QObject):
@@ -18,38 +22,50 @@ class ChangeController:
         def populate_commits(self, head):
             self.control.populate_commits(head)
 
-        @Slot(str)
-        def handle_commit_change(self):
+        @Slot(QItemSelection, QItemSelection)
+        def handle_commit_change(self, selected, deselected):
             self.control.handle_commit_change()
 
         @Slot(QPoint)
         def handle_context_menu(self, pos):
             self.control.handle_context_menu(pos)
 
-    HEAD_MARKER = '*'
-    HEAD_COL = 0
-    SUMMARY_COL = 1
+        @Slot(QModelIndex, int, int)
+        def commits_loaded(self, parent, first, last):
+            self.control.select_pending()
+
+    SHORT_HEXSHA = 12
 
     def __init__(self,
-                 changes: 'QTableWidget',
+                 changes: 'QTableView',
                  heads: 'QComboBox',
-                 repo: 'api.git.Repo'):
+                 repo: 'api.git.Repo',
+                 tasks: 'ui_ctrl.tasks.TaskRunner'):
         self.changes = changes
         self.heads = heads
         self.repo = repo
+        self.tasks = tasks
+        # commit to select once it is loaded
+        self.pending_revision = None
         self.signals = self.Signals(self)
+        self.model = CommitTableModel(tasks, self.changes, failed=error_handler(self.changes))
+        # searches filter rows through the proxy
+        self.proxy = FilterProxyModel(self.changes)
+        self.proxy.setSourceModel(self.model)
+        self.changes.setModel(self.proxy)
 
         # vertical header sizes
         header = self.changes.verticalHeader()
         header.setFixedWidth(70)
         header.setSectionResizeMode(QHeaderView.Fixed)
-        self.changes.setColumnWidth(self.HEAD_COL, 20)
+        self.changes.setColumnWidth(CommitTableModel.HEAD_COL, 20)
 
-        self.populate_heads()
         self.heads.currentTextChanged.connect(self.signals.populate_commits)
-        self.changes.itemSelectionChanged.connect(self.signals.handle_commit_change)
+        self.changes.selectionModel().selectionChanged.connect(
+                self.signals.handle_commit_change)
         self.changes.customContextMenuRequested.connect(self.signals.handle_context_menu)
-        self.populate_commits(self.heads.currentText()) # populate with HEAD
+        self.model.rowsInserted.connect(self.signals.commits_loaded)
+        self.populate_heads() # populates commits of HEAD
 
     def set_repo(self, repo: 'api.git.Repo'):
         self.repo = repo
@@ -57,34 +73,82 @@ class ChangeController:
     def handle_commit_change(self):
         indexes = self.changes.selectedIndexes()
         if indexes:
-            row_idx = indexes[0].row()
-            revision = self.changes.verticalHeaderItem(row_idx).text()
+            revision = self.revision(indexes[0].row())
             self.signals.change_switched.emit(revision)
 
+    def revision(self, row: int):
+        ''' Revision shown in the view's row '''
+        return self.model.revision(self.proxy.mapToSource(self.proxy.index(row, 0)).row())
+
     def get_selected_revision(self):
-        return self.changes.verticalHeaderItem(self.changes.currentRow()).text()
+        ''' Revision of the current row, None if there is none '''
+        index = self.changes.currentIndex()
+        if not index.isValid():
+            return None
+        return self.revision(index.row())
+
+    def select_revision(self, revision: str):
+        ''' Select the commit, history starting at it is shown if it is
+        not among loaded commits '''
+        if self.model.find(revision) < 0:
+            self.heads.addItem(revision[:self.SHORT_HEXSHA])
+            self.heads.setCurrentIndex(self.heads.count() - 1)
+        self.pending_revision = revision
+        self.select_pending()
+
+    def select_pending(self):
+        row = self.model.find(self.pending_revision) if self.pending_revision else -1
+        if row < 0:
+            return
+        self.pending_revision = None
+        index = self.proxy.mapFromSource(self.model.index(row, 0))
+        self.changes.selectRow(index.row())
+        self.changes.scrollTo(index)
+
+    def populate_heads(self, moved: set[str] = None):
+        ''' Reload heads, commits are reloaded if the shown head is in moved
+        or always if moved is None '''
+        self.tasks.run(
+                self.repo.branches,
+                done=lambda branches: self.fill_heads(branches, moved),
+                failed=error_handler(self.changes)
+        )
 
-    def populate_heads(self):
+    def fill_heads(self, branches: list[str], moved: set[str] = None):
+        current = self.heads.currentText()
+        # keep the shown head if it still exists
+        self.heads.blockSignals(True)
         self.heads.clear()
         self.heads.addItem('HEAD')
-        self.heads.addItems(self.repo.branches())
+        self.heads.addItems(branches)
+        self.heads.setCurrentIndex(max(0, self.heads.findText(current)))
+        self.heads.blockSignals(False)
+        shown = self.heads.currentText()
+        if moved is None or shown != current or shown in moved:
+            self.populate_commits(shown)
 
     def populate_commits(self, revision):
         if not revision:
             return
+        self.pending_revision = None
+        self.tasks.run(
+                self.read_commits, revision,
+                done=partial(self.fill_commits, revision),
+                failed=error_handler(self.changes)
+        )
+
+    def read_commits(self, revision):
+        # log is read page by page as the view scrolls
+        return self.repo.head(), self.repo.revision_log(revision), self.repo.is_shallow()
 
-        self.changes.setRowCount(0)
-        head_hash = self.repo.head()
-        for commit_hash, summary in self.repo.revision_log(revision):
-            row_idx = self.changes.rowCount()
-            self.changes.insertRow(row_idx)
-            self.changes.setVerticalHeaderItem(row_idx, QTableWidgetItem(commit_hash))
-            item = QTableWidgetItem(summary)
-            self.changes.setItem(row_idx, self.SUMMARY_COL, QTableWidgetItem(summary))
-            if commit_hash == head_hash:
-                self.changes.setItem(
-                        row_idx, self.HEAD_COL, QTableWidgetItem(self.HEAD_MARKER))
+    def fill_commits(self, revision, commits: tuple[str, 'Iterator[api.git.Revision]', bool]):
+        head_hash, log, shallow = commits
+        extend = partial(self.load_more_history, revision=revision) if shallow else None
+        self.model.reset(head_hash, log, extend)
 
+    def load_more_history(self, skip: int, revision: str):
+        ''' Deepen shallow clone once the view scrolls past its history '''
+        return self.repo.deepen_log(revision, skip, self.tasks.git_progress())
 
     def checkout(self, revision):
         result = QMessageBox.question(
@@ -96,13 +160,21 @@ class ChangeController:
                 ))
         )
         if result == QMessageBox.StandardButton.Yes:
-            self.repo.checkout(revision)
-            self.populate_heads()
-            self.signals.checked_out.emit(revision)
+            self.tasks.run(
+                    self.repo.checkout, revision,
+                    done=lambda _: self.checked_out(revision),
+                    failed=error_handler(self.changes)
+            )
+
+    def checked_out(self, revision):
+        self.populate_heads()
+        self.signals.checked_out.emit(revision)
 
     def handle_context_menu(self, pos: QPoint):
         row = self.changes.rowAt(pos.y())
-        revision = self.changes.verticalHeaderItem(row).text()
+        if row < 0:
+            return
+        revision = self.revision(row)
         menu = QMenu(self.changes)
         menu.addAction(self.changes.tr('Checkout'), partial(self.checkout, revision=revision))
         menu.exec(self.changes.mapToGlobal(pos))
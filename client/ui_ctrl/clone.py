@@ -1,8 +1,11 @@
 from pathlib import Path
 
 from PySide6.QtCore import QObject, Signal, Slot
-from PySide6.QtWidgets import QWidget, QDialog, QTableWidgetItem, QFileDialog, QMessageBox
+from PySide6.QtWidgets import (
+        QWidget, QDialog, QTableWidgetItem, QFileDialog, QMessageBox, QProgressBar
+)
 
+from common import CloneMode
 from config import Repo
 from ui import Ui_CloneDialog
 
@@ -10,10 +13,16 @@ class CloneDialogController:
 
     NAME_COL = 0
     PATH_COL = 1
+    PROGRESS_COL = 2
+    # in order of mode combo box items
+    MODES = (CloneMode.Full, CloneMode.Partial, CloneMode.Shallow, CloneMode.SingleBranch)
 
     class Signals(QObject):
         repo_paths_selected = Signal((object,)) # list['common.Repo'])
         directory_chosen = Signal((str,))
+        clone_cancelled = Signal()
+        # emitted from clone workers
+        progress = Signal((str, int, int, str))
 
         def __init__(self, control):
             super().__init__()
@@ -31,12 +40,22 @@ class CloneDialogController:
         def accept_dialog(self, clicked):
             self.control.accept_dialog()
 
+        @Slot(str, int, int, str)
+        def update_progress(self, name, current, maximum, message):
+            self.control.update_progress(name, current, maximum, message)
+
+        @Slot()
+        def handle_reject(self):
+            self.control.handle_reject()
+
     def __init__(self, parent: QWidget, last_dir: str, repos: set[str]):
         self.dialog = QDialog(parent)
         self.ui = Ui_CloneDialog()
         self.ui.setupUi(self.dialog)
         self.signals = self.Signals(self)
 
+        self.rows = {}
+        self.cloning = False
         self.populate_table(repos)
         self.last_dir = last_dir
         self.ui.clone.setEnabled(False)
@@ -45,6 +64,8 @@ class CloneDialogController:
         self.ui.repo_table.cellDoubleClicked.connect(self.signals.handle_double_click)
         self.ui.clone.clicked.connect(self.signals.accept_dialog)
         self.ui.cancel.clicked.connect(self.dialog.reject)
+        self.dialog.rejected.connect(self.signals.handle_reject)
+        self.signals.progress.connect(self.signals.update_progress)
 
     def accept_dialog(self):
         repos = []
@@ -54,13 +75,44 @@ class CloneDialogController:
                     self.ui.repo_table.item(row, self.PATH_COL).text()
             )
             repos.append(repo)
-        self.dialog.accept()
+        # dialog stays open to show progress of each clone
+        self.cloning = True
+        self.ui.clone.setEnabled(False)
+        self.ui.repo_table.setEnabled(False)
+        self.ui.mode.setEnabled(False)
         self.signals.repo_paths_selected.emit(repos)
 
+    def mode(self):
+        return self.MODES[self.ui.mode.currentIndex()]
+
+    def handle_reject(self):
+        if self.cloning:
+            self.signals.clone_cancelled.emit()
+
+    def update_progress(self, name: str, current: int, maximum: int, message: str):
+        row = self.rows[name]
+        bar = self.ui.repo_table.cellWidget(row, self.PROGRESS_COL)
+        if bar is None:
+            bar = QProgressBar()
+            self.ui.repo_table.setCellWidget(row, self.PROGRESS_COL, bar)
+        bar.setRange(0, maximum)
+        bar.setValue(current)
+        bar.setFormat(f'{message} %p%' if maximum else message)
+
+    def set_result(self, name: str, result: str):
+        row = self.rows[name]
+        self.ui.repo_table.removeCellWidget(row, self.PROGRESS_COL)
+        self.ui.repo_table.setItem(row, self.PROGRESS_COL, QTableWidgetItem(result))
+
+    def finish(self):
+        self.cloning = False
+        self.dialog.accept()
+
     def populate_table(self, repos: set[str]):
         for repo in repos:
             row = self.ui.repo_table.rowCount()
             self.ui.repo_table.insertRow(row)
+            self.rows[repo] = row
             self.ui.repo_table.setItem(row, self.NAME_COL, QTableWidgetItem(repo))
 
     def handle_double_click(self, row, col):
@@ -80,15 +132,18 @@ class CloneDialogController:
                 QMessageBox.critical(
                         self.dialog,
                         self.dialog.tr('Path exists'),
-                        ' '.join((repo_path, self.dialog.tr('already exists')))
+                        ' '.join((str(repo_path), self.dialog.tr('already exists')))
                 )
 
             self.ui.repo_table.setItem(
                     row, self.PATH_COL, QTableWidgetItem(str(repo_path)))
 
     def try_unlock_clone(self):
+        if self.cloning:
+            return
         for row in range(self.ui.repo_table.rowCount()):
-            if not self.ui.repo_table.item(row, self.PATH_COL).text():
+            item = self.ui.repo_table.item(row, self.PATH_COL)
+            if not item or not item.text():
                 break
         else:
             self.ui.clone.setEnabled(True)
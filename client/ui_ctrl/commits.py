@@ -0,0 +1,137 @@
+from itertools import islice
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+class CommitTableModel(QAbstractTableModel):
+    ''' Commit history loaded in pages from a lazy revision log.
+    Pages are read on the repo's task runner, so git is never touched
+    from the GUI thread '''
+    HEAD_MARKER = '*'
+    HEAD_COL = 0
+    SUMMARY_COL = 1
+    PAGE_SIZE = 500
+
+    def __init__(self,
+                 tasks: 'ui_ctrl.tasks.TaskRunner',
+                 parent=None,
+                 failed: 'Callable[[Exception], None]' = None):
+        super().__init__(parent)
+        self.tasks = tasks
+        self.failed = failed or tasks.reraise
+        self.commits = []
+        self.head = None
+        self.log = None
+        self.extend = None
+        self.extending = False
+        self.fetching = False
+        # pages requested for a previous log are dropped
+        self.generation = 0
+
+    def reset(self,
+              head: str,
+              log: 'Iterator[api.git.Revision]',
+              extend: 'Callable[[int], Iterator[api.git.Revision] | None]' = None):
+        ''' Show commits of log. When it runs out, extend is called on the
+        task runner with the number of loaded commits, it returns the rest
+        of the history or None if there is nothing more '''
+        self.beginResetModel()
+        self.generation += 1
+        self.commits = []
+        self.head = head
+        self.log = log
+        self.extend = extend
+        self.extending = False
+        self.fetching = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def revision(self, row: int):
+        return self.commits[row].hexsha
+
+    def find(self, hexsha: str):
+        ''' Row of a loaded commit, -1 if it is not loaded '''
+        for row, commit in enumerate(self.commits):
+            if commit.hexsha == hexsha:
+                return row
+        return -1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.commits)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        commit = self.commits[index.row()]
+        if index.column() == self.SUMMARY_COL:
+            return commit.summary
+        return self.HEAD_MARKER if commit.hexsha == self.head else None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return self.commits[section].hexsha
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.fetching and (
+                self.log is not None or self.extend is not None)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.fetching = True
+        generation = self.generation
+        if self.log is None:
+            # scrolled past the end of loaded history
+            self.tasks.run(
+                    self.extend, len(self.commits),
+                    done=lambda log: self.extended(generation, log),
+                    failed=lambda ex: self.fetch_failed(generation, ex)
+            )
+            return
+        log = self.log
+        self.tasks.run(
+                lambda: list(islice(log, self.PAGE_SIZE)),
+                done=lambda page: self.add_page(generation, page),
+                failed=lambda ex: self.fetch_failed(generation, ex)
+        )
+
+    def add_page(self, generation: int, page: 'list[api.git.Revision]'):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if self.extending and not page:
+            # extending brought nothing new
+            self.extend = None
+        self.extending = False
+        if len(page) < self.PAGE_SIZE:
+            # log is exhausted
+            self.log = None
+        if page:
+            first = len(self.commits)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.commits.extend(page)
+            self.endInsertRows()
+
+    def extended(self, generation: int, log: 'Iterator[api.git.Revision] | None'):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        self.log = log
+        if log is None:
+            self.extend = None
+        else:
+            self.extending = True
+            self.fetchMore()
+
+    def fetch_failed(self, generation: int, ex: Exception):
+        if generation == self.generation:
+            # stop paging a broken log
+            self.fetching = False
+            self.log = None
+            self.extend = None
+        self.failed(ex)
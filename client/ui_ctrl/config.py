@@ -1,30 +1,36 @@
+from functools import partial
 from shutil import rmtree
 from platform import system
 
-from PySide6.QtCore import QObject, QStandardPaths, Signal, Slot
+from PySide6.QtCore import QObject, QStandardPaths, Qt, Signal, Slot
 from PySide6.QtWidgets import (
         QWidget, QMessageBox, QInputDialog, QDialogButtonBox, QListWidgetItem
 )
 
 from .list_move import ListMoveController
 from .clone import CloneDialogController
-from .errors import show_error
+from .errors import error_handler, git_error_text, show_error
 from .search import ListSearchController
-from api.commands.error import (
-        RepoExistsError, InvalidRepoNameError, RepoNotFoundError, CommandError
-)
-from api.git import GitCommandError
+from .tasks import TaskRunner, emit_batches
+from api.commands.error import InvalidRepoNameError
+from api.git import GitCommandError, GitProgress
 from common import bullet_list
 from ui import Ui_RepoConfigPage
 
 class RepoConfigController:
     class Signals(QObject):
         repos_updated = Signal()
+        # emitted from the worker with batches of remote repo names
+        remotes_found = Signal((int, object))
 
         def __init__(self, control):
             super().__init__()
             self.control = control
 
+        @Slot(int, object) # list
+        def add_remotes(self, generation, names):
+            self.control.add_remotes(generation, names)
+
         @Slot(bool)
         def create_remote_dialog(self, clicked):
             self.control.create_remote_dialog()
@@ -53,6 +59,11 @@ class RepoConfigController:
         def update_last_dir(self, path):
             self.control.update_last_dir(path)
 
+        @Slot(bool)
+        def clone_busy_changed(self, busy):
+            if not busy:
+                self.control.cloned()
+
     def __init__(self,
                  config: 'config.ConfigManager',
                  repo_cmds: 'api.commands.RepoPackage',
@@ -65,15 +76,29 @@ class RepoConfigController:
         self.self_cmds = self_cmds
         self.git_cloner = git_cloner
         self.signals = self.Signals(self)
+        self.signals.remotes_found.connect(self.signals.add_remotes)
 
         # used for cloning dialog
         self.last_dir = self.get_default_dir()
         self.list_move = None
+        # remote names streamed for a previous listing are dropped
+        self.generation = 0
+        self.local_names = set()
 
         # setup UI
         self.ui = Ui_RepoConfigPage()
         self.widget = QWidget()
         self.ui.setupUi(self.widget)
+        self.tasks = TaskRunner(self.widget)
+        # clones run side by side, results are collected until all finish
+        self.clone_tasks = TaskRunner(self.widget, config.get_clone_concurrency())
+        # queued, so it comes after the last clone's callback
+        self.clone_tasks.busy_changed.connect(
+                self.signals.clone_busy_changed, Qt.QueuedConnection)
+        self.clone_dialog = None
+        self.clone_repos = []
+        self.clone_results = {}
+        self.clone_mode = None
 
         self.local_search = ListSearchController(
                 self.ui.local_search_box,
@@ -111,19 +136,29 @@ class RepoConfigController:
         self.git_cloner = git_cloner
 
     def populate_lists(self):
+        ''' Fill local repos at once, remote ones as the server lists them '''
+        self.generation += 1
+        generation = self.generation
         self.ui.local_list.clear()
-        local_repos = set(repo.name for repo in self.config.get_repos())
-        self.ui.local_list.addItems(local_repos)
-
+        self.local_names = set(repo.name for repo in self.config.get_repos())
+        self.ui.local_list.addItems(self.local_names)
         self.ui.remote_list.clear()
-        try:
-            remote_repos = set(self.self_cmds.repos())
-        except CommandError as ex:
-            show_error(self.widget, ex)
-        else:
-            remote_repos -= local_repos
-            self.ui.remote_list.addItems(remote_repos)
+        self.reset_list_move()
+
+        self.tasks.run(
+                lambda: emit_batches(
+                        self.self_cmds.iter_repos(),
+                        partial(self.signals.remotes_found.emit, generation)),
+                failed=error_handler(self.widget)
+        )
 
+    def add_remotes(self, generation: int, names: list[str]):
+        if generation != self.generation:
+            return
+        self.ui.remote_list.addItems(
+                [name for name in names if name not in self.local_names])
+
+    def reset_list_move(self):
         if self.list_move:
             self.list_move.disconnect()
         self.list_move = ListMoveController(
@@ -143,12 +178,15 @@ class RepoConfigController:
             clone = CloneDialogController(self.widget, self.last_dir, remote_clone)
             clone.signals.repo_paths_selected.connect(self.signals.remote_clone)
             clone.signals.directory_chosen.connect(self.signals.update_last_dir)
+            clone.signals.clone_cancelled.connect(self.clone_tasks.cancel)
+            self.clone_dialog = clone
             clone.dialog.exec()
 
     def update_last_dir(self, path):
         self.last_dir = path
 
     def discard(self):
+        self.self_cmds.invalidate(('repos',))
         self.populate_lists()
 
     def create_remote_dialog(self):
@@ -160,12 +198,12 @@ class RepoConfigController:
         
         if ok:
             if remote_name:
-                try:
-                    self.repo_cmds.create(remote_name)
-                except (InvalidRepoNameError, RepoExistsError, CommandError) as ex:
-                    show_error(self.widget, ex)
-                else:
-                    self.ui.remote_list.addItem(QListWidgetItem(remote_name))
+                self.tasks.run(
+                        self.repo_cmds.create, remote_name,
+                        done=lambda _: self.ui.remote_list.addItem(
+                            QListWidgetItem(remote_name)),
+                        failed=error_handler(self.widget)
+                )
             else:
                 show_error(self.widget, InvalidRepoNameError(remote_name))
 
@@ -177,11 +215,11 @@ class RepoConfigController:
                 self.widget.tr('Remove remote repository {}?').format(remote_name)
         )
         if ok == QMessageBox.StandardButton.Yes:
-            err = None
-            try:
-                self.repo_cmds.delete(remote_name)
-            except (RepoNotFoundError, CommandError) as ex:
-                show_error(self.widget, ex)
+            self.tasks.run(
+                    self.repo_cmds.delete, remote_name,
+                    done=lambda _: self.populate_lists(),
+                    failed=error_handler(self.widget)
+            )
 
     def local_delete_dialog(self, local_delete: set[str]):
         repo_text = bullet_list(local_delete)
@@ -227,23 +265,59 @@ class RepoConfigController:
         self.signals.repos_updated.emit()
 
     def remote_clone(self, repos: list['common.Repo']):
-        not_cloned = set()
+        self.clone_repos = repos
+        self.clone_results = {}
+        self.clone_mode = self.clone_dialog.mode()
         for repo in repos:
-            try:
-                self.git_cloner.clone(repo)
+            # progress is reported from the worker to the dialog row
+            progress = GitProgress(partial(self.clone_dialog.signals.progress.emit, repo.name))
+            self.clone_tasks.run(
+                    self.clone_repo, repo, progress, self.clone_mode,
+                    done=partial(self.clone_done, repo),
+                    failed=lambda ex, repo=repo: self.clone_done(repo, str(ex)),
+                    on_cancel=progress.cancel
+            )
+
+    def clone_repo(self,
+                   repo: 'common.Repo',
+                   progress: 'api.git.GitProgress',
+                   mode: 'common.CloneMode'):
+        ''' Clone on a worker, returns error text, empty if cancelled, None on success '''
+        try:
+            self.git_cloner.clone(repo, progress, mode)
+        except GitCommandError as ex:
+            return '' if progress.cancelled else git_error_text(ex)
+        return None
+
+    def clone_done(self, repo: 'common.Repo', error: str):
+        self.clone_results[repo.name] = error
+        if error is None:
+            result = self.widget.tr('Cloned')
+        else:
+            result = error or self.widget.tr('cancelled')
+        self.clone_dialog.set_result(repo.name, result)
+
+    def cloned(self):
+        if self.clone_dialog is None:
+            return
+        self.clone_dialog.finish()
+        self.clone_dialog = None
+        cloned = [repo for repo in self.clone_repos if
+                  repo.name in self.clone_results and self.clone_results[repo.name] is None]
+        # repos never started were cancelled
+        not_cloned = {repo.name: self.clone_results.get(repo.name) or None
+                      for repo in self.clone_repos if repo not in cloned}
+        with self.config.batch():
+            for repo in cloned:
                 self.config.add_repo(repo)
-            except GitCommandError as ex:
-                QMessageBox.critical(
-                        self.widget,
-                        self.widget.tr('Git error'),
-                        ex.message
-                )
-                not_cloned.add(repo.name)
+                self.config.set_clone_mode(repo.name, self.clone_mode)
         if not_cloned:
             QMessageBox.critical(
                     self.widget,
                     self.widget.tr('Cloning failed'),
-                    self.widget.tr('Failed to clone repositories:') + bullet_list(not_cloned)
+                    self.widget.tr('Failed to clone repositories:') + '\n' + bullet_list(
+                        f'{name}: {error or self.widget.tr("cancelled")}'
+                        for name, error in not_cloned.items())
             )
         else:
             QMessageBox.information(
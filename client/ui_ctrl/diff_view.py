@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from itertools import islice
+
+from PySide6.QtCore import QObject, Slot
+from PySide6.QtGui import QTextCursor
+
+@dataclass(frozen=True)
+class DiffLimits:
+    # changed lines above which a diff loads only on request
+    max_lines: int = 20000
+    # bytes of text kept in the viewer
+    memory: int = 16 << 20
+
+class DiffViewController:
+    ''' Shows a file diff streamed in chunks on the repo's task runner.
+    More is read as the view nears its end, text scrolled far above is
+    released to keep the document within the memory budget '''
+    class Signals(QObject):
+        def __init__(self, control):
+            super().__init__()
+            self.control = control
+
+        @Slot(int)
+        def scrolled(self, value):
+            self.control.scrolled(value)
+
+        @Slot()
+        def load_all(self):
+            self.control.load(force=True)
+
+    # chunks of up to 64 KiB read per page
+    PAGE_CHUNKS = 2
+
+    def __init__(self,
+                 view: 'QPlainTextEdit',
+                 notice_widget: 'QWidget',
+                 notice: 'QLabel',
+                 notice_btn: 'QPushButton',
+                 tasks: 'ui_ctrl.tasks.TaskRunner',
+                 repo: 'api.git.GitRepo',
+                 limits: DiffLimits,
+                 failed: 'Callable[[Exception], None]' = None):
+        self.view = view
+        self.notice_widget = notice_widget
+        self.notice = notice
+        self.notice_btn = notice_btn
+        self.tasks = tasks
+        self.repo = repo
+        self.limits = limits
+        self.failed = failed or tasks.reraise
+        self.signals = self.Signals(self)
+        self.revision = None
+        self.path = None
+        self.chunks = None
+        self.fetching = False
+        # lines released from the top of the document
+        self.released = 0
+        # whether the shown text is missing its last line end
+        self.line_end = False
+        # pages requested for a previous file are dropped
+        self.generation = 0
+
+        # released text must not stay on the undo stack
+        self.view.setUndoRedoEnabled(False)
+        self.notice_widget.hide()
+        self.view.verticalScrollBar().valueChanged.connect(self.signals.scrolled)
+        self.notice_btn.clicked.connect(self.signals.load_all)
+
+    def set_repo(self, repo: 'api.git.GitRepo'):
+        self.repo = repo
+
+    def show(self, revision: str, path: str):
+        self.revision = revision
+        self.path = path
+        self.load()
+
+    def load(self, force: bool = False):
+        ''' Read the diff from its start, binary and large files only
+        get a summary unless forced '''
+        self.clear()
+        generation = self.generation
+        self.fetching = True
+        self.tasks.run(
+                self.open_diff, self.repo, self.revision, self.path, force,
+                done=lambda result: self.opened(generation, result),
+                failed=lambda ex: self.fetch_failed(generation, ex)
+        )
+
+    def clear(self):
+        self.generation += 1
+        self.close_chunks()
+        self.fetching = False
+        self.released = 0
+        self.line_end = False
+        self.view.clear()
+        self.notice_widget.hide()
+
+    def close_chunks(self):
+        if self.chunks is not None:
+            # after a page being read, the runner runs tasks one by one
+            self.tasks.run(self.chunks.close)
+            self.chunks = None
+
+    def open_diff(self, repo: 'api.git.GitRepo', revision: str, path: str, force: bool):
+        ''' Runs on the task runner. Returns numstat of the file,
+        the diff chunks and their first page '''
+        stat = repo.commit_numstat(revision).get(path, [0, 0])
+        if stat is None or (not force and sum(stat) > self.limits.max_lines):
+            return stat, None, []
+        chunks = repo.diff_chunks(revision, path)
+        return stat, chunks, list(islice(chunks, self.PAGE_CHUNKS))
+
+    def opened(self, generation: int, result: tuple):
+        stat, chunks, page = result
+        if generation != self.generation:
+            if chunks is not None:
+                self.tasks.run(chunks.close)
+            return
+        if stat is None:
+            self.show_notice(self.view.tr('Binary file, no text difference to show'))
+        elif chunks is None:
+            self.show_notice(
+                    self.view.tr('Large difference: +{} -{} lines').format(*stat),
+                    self.view.tr('Load anyway'))
+        self.chunks = chunks
+        self.add_page(generation, page)
+
+    def fetch_more(self):
+        if self.chunks is None or self.fetching:
+            return
+        self.fetching = True
+        generation = self.generation
+        chunks = self.chunks
+        self.tasks.run(
+                lambda: list(islice(chunks, self.PAGE_CHUNKS)),
+                done=lambda page: self.add_page(generation, page),
+                failed=lambda ex: self.fetch_failed(generation, ex)
+        )
+
+    def add_page(self, generation: int, page: list[str]):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if len(page) < self.PAGE_CHUNKS:
+            # diff is exhausted
+            self.chunks = None
+        # the last line end waits for more text, so the view ends with no empty line
+        text = ''.join(page)
+        if text:
+            text = '\n' * self.line_end + text
+            self.line_end = text.endswith('\n')
+            text = text.removesuffix('\n')
+            cursor = QTextCursor(self.view.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+            self.release_above()
+        bar = self.view.verticalScrollBar()
+        if bar.maximum() == 0 or bar.value() >= bar.maximum() - bar.pageStep():
+            # view is not filled or still near its end
+            self.fetch_more()
+
+    def release_above(self):
+        ''' Drop whole lines from the top while the document is over budget,
+        keeping the visible lines in place '''
+        document = self.view.document()
+        # QString keeps 2 bytes per character
+        excess = document.characterCount() - self.limits.memory // 2
+        if excess <= 0:
+            return
+        keep = document.findBlock(excess).next()
+        if not keep.isValid():
+            return
+        lines = keep.blockNumber()
+        bar = self.view.verticalScrollBar()
+        value = bar.value()
+        cursor = QTextCursor(document)
+        cursor.setPosition(keep.position(), QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        bar.setValue(max(0, value - lines))
+        self.released += lines
+        self.show_notice(
+                self.view.tr('{} lines above were released to save memory').format(self.released),
+                self.view.tr('Show from top'))
+
+    def show_notice(self, text: str, action: str = None):
+        self.notice.setText(text)
+        self.notice_btn.setVisible(action is not None)
+        if action is not None:
+            self.notice_btn.setText(action)
+        self.notice_widget.show()
+
+    def scrolled(self, value: int):
+        bar = self.view.verticalScrollBar()
+        if value >= bar.maximum() - bar.pageStep():
+            self.fetch_more()
+
+    def fetch_failed(self, generation: int, ex: Exception):
+        if generation == self.generation:
+            # stop paging a broken diff
+            self.fetching = False
+            self.chunks = None
+        self.failed(ex)
@@ -1,3 +1,5 @@
+import sys
+
 from PySide6.QtWidgets import QMessageBox
 
 from api.commands.error import (
@@ -14,14 +16,40 @@ from api.commands.error import (
     RepoNotAllowedError,
     CommandError
 )
+from api.git import GitCommandError
+from common import bullet_list
 
 def show_error(widget: 'QWidget', ex: CommandError):
     title = widget.tr(ex.ERR_MSG)
+    QMessageBox.critical(widget, title, error_text(widget, ex))
+
+def show_errors(widget: 'QWidget', title: str, errors: dict[str, CommandError]):
+    ''' Show errors of a bulk command in one message box '''
+    lines = (f'{item}: {error_text(widget, ex)}' for item, ex in errors.items())
+    QMessageBox.critical(widget, title, bullet_list(lines))
+
+def show_git_error(widget: 'QWidget', ex: GitCommandError):
+    QMessageBox.critical(widget, widget.tr('Git error'), git_error_text(ex))
+
+def git_error_text(ex: GitCommandError):
+    stderr = ex.stderr.strip()
+    return stderr.removeprefix("stderr: '").removesuffix("'").strip() or str(ex)
+
+def error_handler(widget: 'QWidget'):
+    ''' Task failure callback that shows command and git errors '''
+    def handle(ex: Exception):
+        if isinstance(ex, CommandError):
+            show_error(widget, ex)
+        elif isinstance(ex, GitCommandError):
+            show_git_error(widget, ex)
+        else:
+            sys.excepthook(type(ex), ex, ex.__traceback__)
+    return handle
+
+def error_text(widget: 'QWidget', ex: CommandError):
     if type(ex) in ERROR_TABLE:
-        label = widget.tr(ERROR_TABLE[type(ex)]).format(*ex.args[1:])
-    else:
-        label = ex.args[0]
-    QMessageBox.critical(widget, title, label)
+        return widget.tr(ERROR_TABLE[type(ex)]).format(*ex.args[1:])
+    return ex.args[0]
 
 ERROR_TABLE = {
         InvalidLoginError:    'Login is not valid. Login may consist of ' \
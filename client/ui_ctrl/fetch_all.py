@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from time import perf_counter
+
+from PySide6.QtCore import QObject, Qt, Signal, Slot
+from PySide6.QtWidgets import QMessageBox
+
+from .errors import git_error_text
+from .tasks import TaskRunner
+
+from api.git import GitCommandError, GitProgress, GitRepo
+from common import bullet_list
+
+@dataclass(frozen=True)
+class FetchResult:
+    name: str
+    elapsed: float
+    error: Exception = None
+
+def fetch_repo(repo: 'common.Repo', creds: 'api.ssh.SSHCreds', progress: GitProgress):
+    ''' Fetch on a worker, errors are reported in the summary '''
+    start = perf_counter()
+    try:
+        git_repo = GitRepo.get(repo, creds)
+        # waits for git work of an open repo page on the same work tree
+        with git_repo.work_tree_lock():
+            start = perf_counter()
+            git_repo.fetch(progress)
+    except Exception as ex:
+        if progress.cancelled:
+            # listed as cancelled in the summary
+            raise
+        return FetchResult(repo.name, perf_counter() - start, ex)
+    return FetchResult(repo.name, perf_counter() - start)
+
+class FetchAllController:
+    ''' Fetches all configured repos, at most `concurrency` at once '''
+    class Signals(QObject):
+        fetched = Signal((list,))
+
+        def __init__(self, control):
+            super().__init__()
+            self.control = control
+
+        @Slot(bool)
+        def busy_changed(self, busy):
+            if not busy:
+                self.control.finish()
+
+    def __init__(self, widget: 'QWidget', concurrency: int):
+        self.widget = widget
+        self.signals = self.Signals(self)
+        self.tasks = TaskRunner(self.signals, max_threads=concurrency)
+        # queued, so the summary comes after the last task's callback
+        self.tasks.busy_changed.connect(self.signals.busy_changed, Qt.QueuedConnection)
+        self.repos = []
+        self.results = []
+        self.start = None
+
+    def fetch(self, repos: list['common.Repo'], creds: 'api.ssh.SSHCreds'):
+        if self.tasks.is_busy() or not repos:
+            return
+        self.repos = repos
+        self.results = []
+        self.start = perf_counter()
+        for repo in repos:
+            progress = GitProgress()
+            self.tasks.run(
+                    fetch_repo, repo, creds, progress,
+                    done=self.fetched,
+                    on_cancel=progress.cancel
+            )
+        self.tasks.set_progress(0, len(repos), self.widget.tr('Fetching repositories'))
+
+    def fetched(self, result: FetchResult):
+        self.results.append(result)
+        self.tasks.set_progress(
+                len(self.results), len(self.repos),
+                ''.join((self.widget.tr('Fetched'), ' ', result.name)))
+
+    def finish(self):
+        if self.start is None:
+            return
+        wall_time = perf_counter() - self.start
+        self.start = None
+        self.show_summary(wall_time)
+        self.signals.fetched.emit([result.name for result in self.results])
+
+    def show_summary(self, wall_time: float):
+        failed = [result for result in self.results if result.error]
+        fetched = {result.name for result in self.results}
+        cancelled = [repo.name for repo in self.repos if repo.name not in fetched]
+        repo_time = sum(result.elapsed for result in self.results)
+        text = self.widget.tr(
+                'Fetched {} of {} repositories in {:.1f} s '
+                '(sum of per-repository times {:.1f} s)').format(
+                        len(self.results) - len(failed), len(self.repos),
+                        wall_time, repo_time)
+
+        details = [f'{result.name}: {result.elapsed:.1f} s' for result in self.results
+                   if not result.error]
+        details += [f'{result.name}: {self.error_text(result.error)}' for result in failed]
+        details += [f'{name}: {self.widget.tr("cancelled")}' for name in cancelled]
+        box = QMessageBox(
+                QMessageBox.Warning if failed or cancelled else QMessageBox.Information,
+                self.widget.tr('Fetch complete'), text, parent=self.widget)
+        box.setDetailedText(bullet_list(sorted(details)))
+        box.exec()
+
+    @staticmethod
+    def error_text(ex: Exception):
+        if isinstance(ex, GitCommandError):
+            return git_error_text(ex)
+        return str(ex)
@@ -0,0 +1,148 @@
+from collections import deque
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+class PathNode:
+    ''' File or directory of a path trie, directories share their prefix '''
+    __slots__ = ('name', 'parent', 'path', 'children', 'rows', 'row')
+
+    def __init__(self, name: str, parent: 'PathNode' = None, path: str = None):
+        self.name = name
+        self.parent = parent
+        # full path of files, None for directories
+        self.path = path
+        # {name: PathNode} of directories, None for files.
+        # Subdirectories are keyed 'name/', a commit may replace a file by a directory
+        self.children = None if path else {}
+        # children shown in the view, listed once the node is expanded
+        self.rows = None
+        self.row = 0
+
+def build_path_trie(root_name: str, paths: 'Iterable[str]'):
+    ''' Return root directory of paths, children keep the order of paths '''
+    root = PathNode(root_name)
+    for path in paths:
+        node = root
+        *dirs, name = path.split('/')
+        for part in dirs:
+            child = node.children.get(f'{part}/')
+            if child is None:
+                child = node.children[f'{part}/'] = PathNode(part, node)
+            node = child
+        node.children[name] = PathNode(name, node, path)
+    return root
+
+class FileTreeModel(QAbstractItemModel):
+    ''' Files of a commit under a single root directory. Directory rows are
+    created when the directory is expanded '''
+    PATH_ROLE = Qt.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = PathNode('')
+        self.root.rows = []
+        self.numstat = {}
+
+    def reset(self, root_name: str, paths: list[str]):
+        self.beginResetModel()
+        self.root = PathNode('')
+        top = build_path_trie(root_name, paths)
+        top.parent = self.root
+        self.root.children[f'{root_name}/'] = top
+        self.root.rows = [top] if paths else []
+        self.numstat = {}
+        self.endResetModel()
+
+    def set_numstat(self, numstat: dict[str, list[int]]):
+        ''' Line counts shown as tooltips, they are read on hover '''
+        self.numstat = numstat
+
+    def node(self, index: QModelIndex) -> PathNode:
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if column != 0 or node.rows is None or not 0 <= row < len(node.rows):
+            return QModelIndex()
+        return self.createIndex(row, column, node.rows[row])
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        rows = self.node(parent).rows
+        return len(rows) if rows else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        return bool(self.node(parent).children)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return bool(node.children) and node.rows is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        node = self.node(parent)
+        children = list(node.children.values())
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        for row, child in enumerate(children):
+            child.row = row
+        node.rows = children
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        match role:
+            case Qt.DisplayRole:
+                return node.name
+            case self.PATH_ROLE:
+                return node.path
+            case Qt.ToolTipRole if node.path in self.numstat:
+                stat = self.numstat[node.path]
+                return f'+{stat[0]} -{stat[1]}' if stat else self.tr('Binary')
+        return None
+
+    def path_index(self, path: str):
+        ''' Index of the file, listing directories on the way '''
+        if not self.root.rows:
+            return QModelIndex()
+        index = self.index(0, 0)
+        *dirs, name = path.split('/')
+        for key in [f'{part}/' for part in dirs] + [name]:
+            self.fetchMore(index)
+            child = self.node(index).children.get(key)
+            if child is None:
+                return QModelIndex()
+            index = self.index(child.row, 0, index)
+        return index
+
+    def expand_small(self, view: 'QTreeView', max_children: int, max_rows: int):
+        ''' Expand directories breadth first while they have at most
+        max_children entries and at most max_rows rows are shown '''
+        shown = 0
+        pending = deque([self.index(0, 0)] if self.root.rows else [])
+        while pending:
+            index = pending.popleft()
+            children = self.node(index).children
+            if len(children) > max_children or shown + len(children) > max_rows:
+                continue
+            self.fetchMore(index)
+            view.expand(index)
+            shown += len(children)
+            pending.extend(self.index(child.row, 0, index)
+                           for child in children.values() if child.children)
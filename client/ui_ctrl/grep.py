@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from functools import partial
+from time import perf_counter
+
+from PySide6.QtCore import QObject, Qt, QTimer, Signal, Slot
+from PySide6.QtWidgets import QDialog, QTreeWidgetItem
+
+from .errors import git_error_text
+from .tasks import TaskRunner, emit_batches
+
+from api.git import GitCommandError, GitProgress, GitRepo
+from ui import Ui_GrepDialog
+
+@dataclass(frozen=True)
+class GrepQuery:
+    pattern: str
+    revision: str
+    regex: bool
+    ignore_case: bool
+
+def grep_repo(repo: 'common.Repo',
+              creds: 'api.ssh.SSHCreds',
+              query: GrepQuery,
+              max_count: int,
+              progress: GitProgress,
+              found: 'Callable[[list[api.git.GrepMatch]], None]'):
+    ''' Grep on a worker, passing matches to found as they arrive.
+    Returns the number of matches, None if the repo has no such revision '''
+    # own GitRepo, the repo page may use its one meanwhile
+    matches = GitRepo.get(repo, creds).grep(
+            query.pattern, query.revision, max_count,
+            query.regex, query.ignore_case, progress)
+    if matches is None:
+        return None
+    return emit_batches(matches, found)
+
+class GrepController:
+    ''' Greps all repos at a revision in parallel, without touching their
+    working trees. Stops after max_matches matches or timeout seconds '''
+    class Signals(QObject):
+        # emitted from workers
+        found = Signal((int, str, list))
+
+        def __init__(self, control):
+            super().__init__()
+            self.control = control
+
+        @Slot()
+        def search(self):
+            self.control.search()
+
+        @Slot(int, str, list)
+        def add_matches(self, generation, name, matches):
+            self.control.add_matches(generation, name, matches)
+
+        @Slot()
+        def timed_out(self):
+            self.control.stop(self.control.dialog.tr('time limit reached'))
+
+        @Slot(bool)
+        def busy_changed(self, busy):
+            if not busy:
+                self.control.finish()
+
+        @Slot(int)
+        def closed(self, result):
+            self.control.stop(self.control.dialog.tr('cancelled'))
+
+    REPO_COL, FILE_COL, LINE_COL, TEXT_COL = range(4)
+
+    def __init__(self, parent: 'QWidget', concurrency: int):
+        self.dialog = QDialog(parent)
+        self.ui = Ui_GrepDialog()
+        self.ui.setupUi(self.dialog)
+        self.signals = self.Signals(self)
+        self.tasks = TaskRunner(self.dialog, max_threads=concurrency)
+        # queued, so the summary comes after the last task's callback
+        self.tasks.busy_changed.connect(self.signals.busy_changed, Qt.QueuedConnection)
+        self.timer = QTimer(self.dialog)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.signals.timed_out)
+        self.repos = []
+        self.creds = None
+        self.max_matches = None
+        self.timeout = None
+        # matches of an older search are dropped
+        self.generation = 0
+        self.start = None
+        self.count = 0
+        self.searched = []
+        self.missing = []
+        self.errors = {}
+        self.stopped = None
+
+        self.signals.found.connect(self.signals.add_matches)
+        self.ui.search.clicked.connect(self.signals.search)
+        self.ui.pattern.returnPressed.connect(self.signals.search)
+        self.ui.revision.returnPressed.connect(self.signals.search)
+        self.dialog.finished.connect(self.signals.closed)
+
+    def open(self,
+             repos: list['common.Repo'],
+             creds: 'api.ssh.SSHCreds',
+             max_matches: int,
+             timeout: float):
+        self.repos = repos
+        self.creds = creds
+        self.max_matches = max_matches
+        self.timeout = timeout
+        self.dialog.show()
+        self.dialog.raise_()
+        self.dialog.activateWindow()
+
+    def search(self):
+        self.tasks.cancel()
+        self.timer.stop()
+        self.generation += 1
+        self.ui.results.clear()
+        self.ui.status.clear()
+        self.start = None
+        self.count = 0
+        self.searched = []
+        self.missing = []
+        self.errors = {}
+        self.stopped = None
+        query = GrepQuery(
+                self.ui.pattern.text(),
+                self.ui.revision.text().strip() or 'HEAD',
+                self.ui.regex.isChecked(),
+                self.ui.ignore_case.isChecked()
+        )
+        if not query.pattern or not self.repos:
+            return
+        self.start = perf_counter()
+        for repo in self.repos:
+            progress = GitProgress()
+            self.tasks.run(
+                    grep_repo, repo, self.creds, query, self.max_matches, progress,
+                    partial(self.signals.found.emit, self.generation, repo.name),
+                    done=partial(self.grepped, self.generation, repo.name),
+                    failed=partial(self.grep_failed, self.generation, repo.name),
+                    on_cancel=progress.cancel
+            )
+        self.timer.start(int(self.timeout * 1000))
+        self.ui.status.setText(self.dialog.tr('Searching...'))
+
+    def add_matches(self, generation: int, name: str, matches: 'list[api.git.GrepMatch]'):
+        if generation != self.generation or self.stopped:
+            return
+        matches = matches[:self.max_matches - self.count]
+        items = []
+        for match in matches:
+            item = QTreeWidgetItem()
+            item.setText(self.REPO_COL, name)
+            item.setText(self.FILE_COL, match.path)
+            item.setText(self.LINE_COL, str(match.line_no))
+            item.setText(self.TEXT_COL, match.text)
+            items.append(item)
+        self.ui.results.addTopLevelItems(items)
+        self.count += len(matches)
+        self.ui.status.setText(self.dialog.tr('Searching... {} matches').format(self.count))
+        if self.count >= self.max_matches:
+            self.stop(self.dialog.tr('match limit reached'))
+
+    def stop(self, reason: str):
+        if self.start is None or self.stopped:
+            return
+        self.stopped = reason
+        self.timer.stop()
+        self.tasks.cancel()
+
+    def grepped(self, generation: int, name: str, count: int):
+        if generation != self.generation:
+            return
+        if count is None:
+            self.missing.append(name)
+        else:
+            self.searched.append(name)
+
+    def grep_failed(self, generation: int, name: str, ex: Exception):
+        if generation != self.generation:
+            return
+        self.errors[name] = git_error_text(ex) if isinstance(ex, GitCommandError) else str(ex)
+
+    def finish(self):
+        if self.start is None:
+            return
+        elapsed = perf_counter() - self.start
+        self.start = None
+        self.timer.stop()
+        text = self.dialog.tr('{} matches in {} repositories in {:.1f} s').format(
+                self.count, len(self.searched), elapsed)
+        if self.stopped:
+            text += ' ({})'.format(self.stopped)
+        if self.missing:
+            text += '; ' + self.dialog.tr('no such revision in: {}').format(
+                    ', '.join(sorted(self.missing)))
+        if self.errors:
+            text += '; ' + '; '.join(f'{name}: {error}' for name, error in self.errors.items())
+        self.ui.status.setText(text)
+        for col in range(self.TEXT_COL):
+            self.ui.results.resizeColumnToContents(col)
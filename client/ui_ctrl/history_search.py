@@ -0,0 +1,164 @@
+from datetime import datetime
+from functools import partial
+
+from PySide6.QtCore import QObject, Qt, Signal, Slot
+from PySide6.QtWidgets import QDialog, QTreeWidgetItem
+
+from .errors import git_error_text
+from .tasks import TaskRunner
+
+from api.git import GitCommandError, GitRepo
+from ui import Ui_HistorySearchDialog
+
+def search_repo(repo: 'common.Repo',
+                creds: 'api.ssh.SSHCreds',
+                text: str,
+                limit: int,
+                progress: 'api.git.GitProgress'):
+    ''' Update the repo's history index and search it on a worker '''
+    # own GitRepo, the repo page may use its one meanwhile
+    return GitRepo.get(repo, creds).search_history(repo.name, text, limit, progress)
+
+class HistorySearchController:
+    ''' Full-text search over indexed history of one or all repos.
+    Results of each repo are shown as soon as its search is done '''
+    class Signals(QObject):
+        match_activated = Signal((object,))
+
+        def __init__(self, control):
+            super().__init__()
+            self.control = control
+
+        @Slot()
+        def search(self):
+            self.control.search()
+
+        @Slot(QTreeWidgetItem, int)
+        def item_activated(self, item, column):
+            self.match_activated.emit(item.data(*self.control.MATCH_DATA))
+
+        @Slot(int, int, str)
+        def progress_changed(self, current, maximum, message):
+            self.control.show_progress(current, maximum, message)
+
+        @Slot(bool)
+        def busy_changed(self, busy):
+            if not busy:
+                self.control.finish()
+
+        @Slot(int)
+        def closed(self, result):
+            self.control.tasks.cancel()
+
+    MATCH_DATA = (0, Qt.UserRole)
+    REPO_COL, DATE_COL, COMMIT_COL, FILE_COL, MATCH_COL = range(5)
+    # matches shown per repository
+    RESULT_LIMIT = 200
+
+    def __init__(self, parent: 'QWidget', concurrency: int):
+        self.dialog = QDialog(parent)
+        self.ui = Ui_HistorySearchDialog()
+        self.ui.setupUi(self.dialog)
+        self.signals = self.Signals(self)
+        self.tasks = TaskRunner(self.dialog, max_threads=concurrency)
+        self.tasks.progress_changed.connect(self.signals.progress_changed)
+        # queued, so the summary comes after the last task's callback
+        self.tasks.busy_changed.connect(self.signals.busy_changed, Qt.QueuedConnection)
+        self.repos = []
+        self.current = None
+        self.creds = None
+        # results of an older search are dropped
+        self.generation = 0
+        self.searched = []
+        self.truncated = False
+        self.errors = {}
+
+        self.ui.search.clicked.connect(self.signals.search)
+        self.ui.query.returnPressed.connect(self.signals.search)
+        self.ui.results.itemActivated.connect(self.signals.item_activated)
+        self.dialog.finished.connect(self.signals.closed)
+
+    def open(self,
+             repos: list['common.Repo'],
+             current: str,
+             creds: 'api.ssh.SSHCreds',
+             text: str = ''):
+        ''' Show the dialog, search text in current repo or in all repos if
+        current is None '''
+        self.repos = repos
+        self.current = current
+        self.creds = creds
+        self.ui.all_repos.setEnabled(current is not None)
+        self.ui.all_repos.setChecked(current is None or self.ui.all_repos.isChecked())
+        self.dialog.show()
+        self.dialog.raise_()
+        self.dialog.activateWindow()
+        if text:
+            self.ui.query.setText(text)
+            self.search()
+
+    def search(self):
+        text = self.ui.query.text().strip()
+        self.tasks.cancel()
+        self.generation += 1
+        self.ui.results.clear()
+        self.ui.status.clear()
+        self.searched = []
+        self.truncated = False
+        self.errors = {}
+        if not text:
+            return
+        if self.ui.all_repos.isChecked():
+            repos = self.repos
+        else:
+            repos = [repo for repo in self.repos if repo.name == self.current]
+        for repo in repos:
+            progress = self.tasks.git_progress()
+            self.tasks.run(
+                    search_repo, repo, self.creds, text, self.RESULT_LIMIT, progress,
+                    done=partial(self.found, self.generation, repo.name),
+                    failed=partial(self.search_failed, self.generation, repo.name),
+                    on_cancel=progress.cancel
+            )
+        self.ui.status.setText(self.dialog.tr('Searching...'))
+
+    def found(self, generation: int, name: str, matches: 'list[api.history_index.HistoryMatch]'):
+        if generation != self.generation:
+            return
+        self.searched.append(name)
+        self.truncated = self.truncated or len(matches) == self.RESULT_LIMIT
+        items = []
+        for match in matches:
+            item = QTreeWidgetItem()
+            item.setText(self.REPO_COL, match.repo)
+            item.setText(self.DATE_COL,
+                         datetime.fromtimestamp(match.author_time).strftime('%Y-%m-%d %H:%M'))
+            item.setText(self.COMMIT_COL, f'{match.hexsha[:8]} {match.summary}')
+            item.setText(self.FILE_COL, match.path or '')
+            item.setText(self.MATCH_COL, ' '.join(match.snippet.split()))
+            item.setToolTip(self.MATCH_COL, match.snippet)
+            item.setData(*self.MATCH_DATA, match)
+            items.append(item)
+        self.ui.results.addTopLevelItems(items)
+
+    def search_failed(self, generation: int, name: str, ex: Exception):
+        if generation != self.generation:
+            return
+        self.errors[name] = git_error_text(ex) if isinstance(ex, GitCommandError) else str(ex)
+
+    def show_progress(self, current: int, maximum: int, message: str):
+        self.ui.status.setText(f'{message} {current}/{maximum}' if maximum else message)
+
+    def finish(self):
+        if not self.searched and not self.errors:
+            # cancelled or nothing searched
+            return
+        text = self.dialog.tr('{} matches in {} repositories').format(
+                self.ui.results.topLevelItemCount(), len(self.searched))
+        if self.truncated:
+            text += self.dialog.tr(' (newest {} per repository)').format(self.RESULT_LIMIT)
+        if self.errors:
+            text += '; ' + '; '.join(f'{name}: {error}' for name, error in self.errors.items())
+        self.ui.status.setText(text)
+        for col in range(self.MATCH_COL):
+            self.ui.results.resizeColumnToContents(col)
@@ -3,6 +3,8 @@ from dataclasses import dataclass, field
 from PySide6.QtCore import Signal, QObject
 from PySide6.QtWidgets import QWidget
 
+from .errors import error_handler
+from .tasks import TaskRunner
 from api.ssh import SSH, SSHCreds
 from api.commands.packages import SelfPackage
 from common import Role
@@ -15,6 +17,8 @@ class LoginController:
     def __init__(self, config: 'config.ConfigManager'):
         self.config = config
         self.signals = self.Signals()
+        self.tasks = TaskRunner(self.signals)
+        self.tasks.busy_changed.connect(self.set_busy)
 
     def init_ui(self, window: 'QMainWindow'):
         self.ui = Ui_Login()
@@ -28,12 +32,23 @@ class LoginController:
 
     def handle_login(self):
         creds = self.get_ui_creds(self.ui)
-        ssh = SSH.get(creds)
-        self_pkg = SelfPackage(ssh)
-        role = Role(self_pkg.role())
+        self.tasks.run(
+                self.request_role, creds,
+                done=lambda role: self.logged_in(role, creds),
+                failed=error_handler(self.window)
+        )
+
+    @staticmethod
+    def request_role(creds: SSHCreds):
+        return Role(SelfPackage(SSH.get(creds)).role())
+
+    def logged_in(self, role: Role, creds: SSHCreds):
         self.config.save_creds(creds)
         self.signals.logged_in.emit(role, creds)
 
+    def set_busy(self, busy: bool):
+        self.ui.login_button.setEnabled(not busy)
+
     @staticmethod
     def set_ui_creds(ui: Ui_Login, creds: SSHCreds):
         if creds.host:
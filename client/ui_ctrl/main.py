@@ -1,7 +1,18 @@
+from dataclasses import dataclass
+
 from PySide6.QtCore import QObject, Slot, Signal
-from PySide6.QtWidgets import QInputDialog, QMessageBox, QLineEdit
+from PySide6.QtGui import QIcon
+from PySide6.QtWidgets import (
+        QInputDialog, QLabel, QLineEdit, QMessageBox, QProgressBar, QStyle, QToolButton,
+        QVBoxLayout, QWidget
+)
 
 from .config import RepoConfigController
+from .diff_view import DiffLimits
+from .errors import error_handler
+from .fetch_all import FetchAllController
+from .grep import GrepController
+from .history_search import HistorySearchController
 from .repo import RepoPageController
 from .user_admin import AdminUserController
 from .user_owner import OwnerUserController
@@ -10,12 +21,24 @@ from .repo_users import RepoUsersController
 from api.commands.packages import (
         AdminPackage, AccessPackage, RepoPackage, SelfPackage, UserPackage
 )
-from api.commands.error import InvalidPasswordError, CommandError
-from api.ssh import SSH
+from api.commands.cache import CACHE
+from api.commit_cache import COMMITS
+from api.ssh import CONNECTIONS, SSH
 from api.git import GitRepo, GitCloner
-from common import Role
+from common import Repo, Role
 from ui import Ui_MainWindow
 
+@dataclass
+class RepoTab:
+    ''' Repo tab, its page is created on first activation '''
+    repo: Repo
+    widget: QWidget
+    page: RepoPageController = None
+
+    @property
+    def tasks(self):
+        return self.page.tasks if self.page else None
+
 class MainController:
     class Signals(QObject):
         logged_out = Signal()
@@ -30,7 +53,8 @@ class MainController:
 
         @Slot(int)
         def discard(self, tab_idx):
-            self.control.config_tab.discard()
+            # drop unapplied changes, remote list may come from the cache
+            self.control.config_tab.populate_lists()
 
         @Slot(bool)
         def open_users(self, checked):
@@ -44,6 +68,10 @@ class MainController:
         def check_enable_repo_menu(self, row):
             self.control.check_enable_repo_menu(row)
 
+        @Slot(int)
+        def open_tab(self, idx):
+            self.control.open_tab(idx)
+
         @Slot()
         def refresh(self):
             self.control.refresh()
@@ -52,6 +80,26 @@ class MainController:
         def fetch(self):
             self.control.fetch()
 
+        @Slot()
+        def fetch_all(self):
+            self.control.fetch_all()
+
+        @Slot()
+        def grep_all(self):
+            self.control.grep_all()
+
+        @Slot(list)
+        def repos_fetched(self, names):
+            self.control.repos_fetched(names)
+
+        @Slot(str)
+        def search_history(self, text):
+            self.control.search_history(text)
+
+        @Slot(object)
+        def show_history_match(self, match):
+            self.control.show_history_match(match)
+
         @Slot()
         def push(self):
             self.control.push()
@@ -60,6 +108,16 @@ class MainController:
         def change_passwd(self):
             self.control.change_passwd()
 
+        @Slot()
+        def update_status(self):
+            self.control.update_status()
+
+        @Slot(bool)
+        def cancel_tasks(self, _):
+            tasks = self.control.current_tasks()
+            if tasks:
+                tasks.cancel()
+
     CONFIG_TAB = 'Repository management'
 
     def __init__(self,
@@ -70,6 +128,8 @@ class MainController:
         self.config = config
         self.creds = creds
         self.signals = self.Signals(self)
+        CACHE.ttl = config.get_cache_ttl()
+        COMMITS.persistent = config.get_commit_cache()
 
         ssh = SSH.get(creds)
         self.config_tab = RepoConfigController(
@@ -81,39 +141,165 @@ class MainController:
         )
         self.repos = {}
         self.config_tab.signals.repos_updated.connect(self.signals.populate_tabs)
+        self.config_tab.tasks.busy_changed.connect(self.signals.update_status)
+        self.config_tab.tasks.progress_changed.connect(self.signals.update_status)
 
     def init_ui(self, window: 'QMainWindow'):
         self.ui = Ui_MainWindow()
         self.window = window
         self.ui.setupUi(window)
+        self.fetcher = FetchAllController(self.window, self.config.get_fetch_concurrency())
+        self.fetcher.tasks.busy_changed.connect(self.signals.update_status)
+        self.fetcher.tasks.progress_changed.connect(self.signals.update_status)
+        self.fetcher.signals.fetched.connect(self.signals.repos_fetched)
+        self.history_search = HistorySearchController(
+                self.window, self.config.get_search_concurrency())
+        self.history_search.signals.match_activated.connect(self.signals.show_history_match)
+        self.grep = GrepController(self.window, self.config.get_search_concurrency())
         self.ui.tab_widget.currentChanged.connect(self.signals.discard)
+        self.ui.tab_widget.currentChanged.connect(self.signals.open_tab)
+        self.ui.tab_widget.addTab(self.config_tab.widget, self.window.tr(self.CONFIG_TAB))
         self.setup_actions()
+        self.setup_status()
         self.populate_tabs()
+        self.ui.tab_widget.setCurrentIndex(0)
 
     def update_creds(self, creds: 'api.ssh.SSHCreds'):
+        CONNECTIONS.close(self.creds)
         self.creds = creds
         ssh = SSH.get(creds)
         self.config_tab.replace_ssh(
                 RepoPackage(ssh),
                 SelfPackage(ssh),
                 GitCloner.get(creds))
-        self.populate_tabs()
+        for repo_tab in self.repos.values():
+            if repo_tab.page:
+                repo_tab.page.set_repo(GitRepo.get(repo_tab.repo, creds))
+
+    def close(self):
+        for repo_tab in self.repos.values():
+            if repo_tab.page:
+                repo_tab.page.tasks.shutdown()
+        self.config_tab.tasks.shutdown()
+        self.config_tab.clone_tasks.shutdown()
+        self.fetcher.tasks.shutdown()
+        self.history_search.tasks.shutdown()
+        self.grep.tasks.shutdown()
+        status_bar = self.window.statusBar()
+        for widget in (self.progress_label, self.progress_bar, self.cancel_button):
+            status_bar.removeWidget(widget)
+            widget.deleteLater()
+        status_bar.hide()
+        CONNECTIONS.close(self.creds)
+        CACHE.clear()
+        COMMITS.close()
 
     def populate_tabs(self):
-        self.ui.tab_widget.clear()
-        self.repos.clear()
-        for repo in self.config.get_repos():
-            repo_tab = RepoPageController(repo.name, GitRepo.get(repo, self.creds))
-            self.ui.tab_widget.addTab(repo_tab.widget, repo.name)
-            self.repos[repo.name] = repo_tab
-        self.ui.tab_widget.addTab(self.config_tab.widget, self.window.tr(self.CONFIG_TAB))
-        self.check_enable_repo_menu(self.ui.tab_widget.currentIndex())
+        ''' Sync tabs with configured repos, touching only added and removed ones '''
+        repos = {repo.name: repo for repo in self.config.get_repos()}
+        tab_widget = self.ui.tab_widget
+        for name, repo_tab in list(self.repos.items()):
+            if repos.get(name) != repo_tab.repo:
+                self.remove_tab(name)
+        for name, repo in repos.items():
+            if name in self.repos:
+                continue
+            # placeholder, the page is created when the tab is opened
+            widget = QWidget()
+            layout = QVBoxLayout(widget)
+            layout.setContentsMargins(0, 0, 0, 0)
+            self.repos[name] = RepoTab(repo, widget)
+            # config tab stays last
+            # & would mark an accelerator
+            tab_widget.insertTab(tab_widget.count() - 1, widget, name.replace('&', '&&'))
+        self.open_tab(tab_widget.currentIndex())
+        self.check_enable_repo_menu(tab_widget.currentIndex())
+        self.update_status()
+
+    def remove_tab(self, name: str):
+        repo_tab = self.repos.pop(name)
+        if repo_tab.page:
+            repo_tab.page.tasks.shutdown()
+        self.ui.tab_widget.removeTab(self.ui.tab_widget.indexOf(repo_tab.widget))
+        repo_tab.widget.deleteLater()
+
+    def open_tab(self, idx: int):
+        repo_tab = self.tab_at(idx)
+        if repo_tab is None or repo_tab.page:
+            return
+        diff_limits = DiffLimits(self.config.get_diff_max_lines(), self.config.get_diff_memory())
+        page = RepoPageController(
+                repo_tab.repo.name, GitRepo.get(repo_tab.repo, self.creds), diff_limits)
+        page.tasks.busy_changed.connect(self.signals.update_status)
+        page.tasks.progress_changed.connect(self.signals.update_status)
+        page.signals.history_search_requested.connect(self.signals.search_history)
+        repo_tab.widget.layout().addWidget(page.widget)
+        repo_tab.page = page
+
+    def tab_at(self, idx: int):
+        ''' RepoTab shown at idx, None for config tab '''
+        widget = self.ui.tab_widget.widget(idx)
+        return next((repo_tab for repo_tab in self.repos.values() if repo_tab.widget is widget),
+                    None)
+
+    def tab_tasks(self, idx: int):
+        repo_tab = self.tab_at(idx)
+        return repo_tab.tasks if repo_tab else self.config_tab.tasks
+
+    def setup_status(self):
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_label = QLabel()
+        self.cancel_button = QToolButton()
+        self.cancel_button.setText(self.window.tr('Cancel'))
+        self.cancel_button.clicked.connect(self.signals.cancel_tasks)
+        status_bar = self.window.statusBar()
+        status_bar.addPermanentWidget(self.progress_label)
+        status_bar.addPermanentWidget(self.progress_bar)
+        status_bar.addPermanentWidget(self.cancel_button)
+        status_bar.show()
+        self.busy_icon = self.window.style().standardIcon(QStyle.SP_BrowserReload)
+        self.ui.tab_widget.currentChanged.connect(self.signals.update_status)
+
+    def current_tasks(self):
+        tasks = self.tab_tasks(self.ui.tab_widget.currentIndex())
+        # Fetch All is shown on every tab that is not busy itself
+        if not (tasks and tasks.is_busy()) and self.fetcher.tasks.is_busy():
+            return self.fetcher.tasks
+        return tasks
+
+    def update_status(self):
+        # busy indicator on every tab, progress of the current one
+        tab_widget = self.ui.tab_widget
+        for idx in range(tab_widget.count()):
+            tasks = self.tab_tasks(idx)
+            busy = bool(tasks and tasks.is_busy())
+            tab_widget.setTabIcon(idx, self.busy_icon if busy else QIcon())
+
+        tasks = self.current_tasks()
+        busy = bool(tasks and tasks.is_busy())
+        self.progress_label.setVisible(busy)
+        self.progress_bar.setVisible(busy)
+        self.cancel_button.setVisible(busy)
+        if not busy:
+            return
+        if tasks.progress:
+            current, maximum, message = tasks.progress
+            self.progress_bar.setRange(0, maximum)
+            self.progress_bar.setValue(current)
+            self.progress_label.setText(message)
+        else:
+            # unknown amount of work
+            self.progress_bar.setRange(0, 0)
+            self.progress_label.setText(self.window.tr('Working...'))
 
     def setup_actions(self):
         # disable repo menu on config tab
         self.ui.tab_widget.currentChanged.connect(self.signals.check_enable_repo_menu)
         self.ui.repo_refresh.triggered.connect(self.signals.refresh)
         self.ui.repo_fetch.triggered.connect(self.signals.fetch)
+        self.ui.repo_fetch_all.triggered.connect(self.signals.fetch_all)
+        self.ui.repo_grep.triggered.connect(self.signals.grep_all)
         self.ui.self_log_out.triggered.connect(self.signals.logged_out)
         self.ui.self_passwd.triggered.connect(self.signals.change_passwd)
 
@@ -136,17 +322,19 @@ class MainController:
         if not ok:
             return
 
-        try:
-            self_cmds.passwd(passwd)
-        except (InvalidPasswordError, CommandError) as ex:
-            show_error(self.window, ex)
-        else:
-            QMessageBox.information(
-                    self.window,
-                    self.window.tr('Success'),
-                    self.window.tr('Password changed successfully'))
-            new_creds = self.creds.change_password(passwd)
-            self.update_creds(new_creds)
+        self.config_tab.tasks.run(
+                self_cmds.passwd, passwd,
+                done=lambda _: self.passwd_changed(passwd),
+                failed=error_handler(self.window)
+        )
+
+    def passwd_changed(self, passwd: str):
+        QMessageBox.information(
+                self.window,
+                self.window.tr('Success'),
+                self.window.tr('Password changed successfully'))
+        new_creds = self.creds.change_password(passwd)
+        self.update_creds(new_creds)
 
     def refresh(self):
         repo_page = self.get_current_repo()
@@ -156,6 +344,36 @@ class MainController:
         repo_page = self.get_current_repo()
         repo_page.process_fetch()
 
+    def fetch_all(self):
+        self.fetcher.fetch(self.config.get_repos(), self.creds)
+
+    def grep_all(self):
+        self.grep.open(
+                self.config.get_repos(),
+                self.creds,
+                self.config.get_grep_max_matches(),
+                self.config.get_grep_timeout()
+        )
+
+    def repos_fetched(self, names: list[str]):
+        for name in names:
+            repo_tab = self.repos.get(name)
+            if repo_tab and repo_tab.page:
+                repo_tab.page.process_refresh()
+
+    def search_history(self, text: str):
+        current = self.get_current_repo().repo_name
+        self.history_search.open(self.config.get_repos(), current, self.creds, text)
+
+    def show_history_match(self, match: 'api.history_index.HistoryMatch'):
+        repo_tab = self.repos.get(match.repo)
+        if repo_tab is None:
+            return
+        idx = self.ui.tab_widget.indexOf(repo_tab.widget)
+        self.ui.tab_widget.setCurrentIndex(idx)
+        self.open_tab(idx)
+        repo_tab.page.show_match(match.hexsha, match.path)
+
     def push(self):
         repo_page = self.get_current_repo()
         repo_page.process_push()
@@ -186,10 +404,15 @@ class MainController:
 
     def get_current_repo(self):
         idx = self.ui.tab_widget.currentIndex()
-        if idx == self.ui.tab_widget.count() - 1:
+        repo_tab = self.tab_at(idx)
+        if repo_tab is None:
             raise ValueError('Current page is not a repo')
-        repo_name = self.ui.tab_widget.tabText(idx)
-        return self.repos[repo_name]
+        self.open_tab(idx)
+        return repo_tab.page
 
     def check_enable_repo_menu(self, row):
-        self.ui.repo_menu.setEnabled(row != self.ui.tab_widget.count() - 1)
+        # Fetch All and Grep All stay available on config tab
+        is_repo = row != self.ui.tab_widget.count() - 1
+        for action in (self.ui.repo_refresh, self.ui.repo_fetch,
+                       self.ui.repo_push, self.ui.repo_users):
+            action.setEnabled(is_repo)
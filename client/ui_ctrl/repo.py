@@ -1,32 +1,48 @@
 from .search import TableSearchController
 from .changes import ChangeController
+from .diff_view import DiffLimits, DiffViewController
+from .errors import error_handler
+from .files import FileTreeModel
+from .tasks import TaskRunner
 
-from bigtree import list_to_tree, preorder_iter
-from PySide6.QtCore import QObject, Qt, Slot
-from PySide6.QtWidgets import QWidget, QTreeWidgetItem, QInputDialog, QMessageBox
+from PySide6.QtCore import QModelIndex, QObject, Signal, Slot
+from PySide6.QtWidgets import QWidget, QInputDialog, QMessageBox
 
-from api.git import GitRepo, GitCommandError
+from api.git import GitRepo
+from common import bullet_list
 from config import Repo
 from ui.repo import Ui_RepoPage
 
 class RepoPageController:
     class Signals(QObject):
+        history_search_requested = Signal((str,))
+
         def __init__(self, control):
             super().__init__()
             self.control = control
 
+        @Slot()
+        def search_history(self):
+            self.history_search_requested.emit(self.control.ui.history_search_box.text())
+
         @Slot(str)
         def change_switched(self, revision):
             self.control.change_switched(revision)
 
-        @Slot(QTreeWidgetItem, QTreeWidgetItem)
+        @Slot(QModelIndex, QModelIndex)
         def file_switched(self, curr, prev):
             self.control.file_switched(curr)
 
-    PATH_DATA = (0, Qt.UserRole)
+    PATH_DATA = (0, FileTreeModel.PATH_ROLE)
     COMMIT_SUMMARY_COL = 1
-
-    def __init__(self, repo_name: Repo, repo: 'api.git.Repo'):
+    # file tree starts expanded only as far as this stays small
+    EXPAND_CHILDREN = 50
+    EXPAND_ROWS = 500
+
+    def __init__(self,
+                 repo_name: Repo,
+                 repo: 'api.git.Repo',
+                 diff_limits: DiffLimits = DiffLimits()):
         super().__init__()
 
         self.repo_name = repo_name
@@ -37,121 +53,194 @@ class RepoPageController:
         self.ui = Ui_RepoPage()
         self.widget = QWidget()
         self.ui.setupUi(self.widget)
+        # git calls to the repo are serialized on its own worker thread,
+        # and with Fetch All by the work tree lock
+        self.tasks = TaskRunner(self.widget, guard=repo.work_tree_lock())
+        self.change_controller = ChangeController(
+                self.ui.changes, self.ui.head_select, self.repo, self.tasks)
         self.commit_search = TableSearchController(
-                table_widget=self.ui.changes,
+                table_view=self.ui.changes,
                 search_col=self.COMMIT_SUMMARY_COL,
                 search_box=self.ui.changes_search_box,
                 search_btn=self.ui.changes_search_btn
         )
-        self.change_controller = ChangeController(
-                self.ui.changes, self.ui.head_select, self.repo)
+        self.diff_view = DiffViewController(
+                self.ui.diff, self.ui.diff_notice_widget, self.ui.diff_notice,
+                self.ui.diff_notice_btn, self.tasks, self.repo, diff_limits,
+                failed=error_handler(self.widget))
+        self.file_model = FileTreeModel(self.ui.files)
+        self.ui.files.setModel(self.file_model)
         self.ui.commit_msg_widget.hide()
         self.ui.diff_widget.hide()
+        # (revision, path) to show once the commit's files are listed
+        self.pending_match = None
 
         # actions
         self.change_controller.signals.change_switched.connect(
                 self.signals.change_switched)
-        self.ui.files.currentItemChanged.connect(
+        self.ui.files.selectionModel().currentChanged.connect(
                 self.signals.file_switched)
+        self.ui.history_search_box.returnPressed.connect(self.signals.search_history)
+        self.ui.history_search_btn.clicked.connect(self.signals.search_history)
 
     def set_repo(self, repo: 'api.git.GitRepo'):
         self.repo = repo
         self.change_controller.set_repo(repo)
+        self.diff_view.set_repo(repo)
 
     def process_refresh(self):
         self.change_controller.populate_heads()
 
     def process_fetch(self):
-        try:
-            self.repo.fetch()
-        except GitCommandError as ex:
-            QMessageBox.critical(
-                    self.widget,
-                    self.widget.tr('Git error'),
-                    ex.message
-            )
-        else:
+        progress = self.tasks.git_progress()
+        self.tasks.run(
+                self.fetch_changes, progress,
+                done=self.fetch_done,
+                failed=self.transfer_failed,
+                on_cancel=progress.cancel
+        )
+
+    def fetch_changes(self, progress: 'api.git.GitProgress'):
+        ''' Fetch, returns changed refs and heads to reload '''
+        changed = self.repo.fetch(progress)
+        remote = self.repo.remote()
+        moved = {ref.removeprefix(f'{remote}/') for ref in changed}
+        if self.repo.current_branch() in moved:
+            moved.add('HEAD')
+        return changed, moved
+
+    def fetch_done(self, result: tuple[list[str], set[str]]):
+        changed, moved = result
+        if not changed:
             QMessageBox.information(
                     self.widget,
                     self.widget.tr('Fetch complete'),
-                    self.widget.tr('Fetch was completed successfully')
+                    self.widget.tr('Repository is already up to date')
             )
-        self.change_controller.populate_heads()
+            return
+        QMessageBox.information(
+                self.widget,
+                self.widget.tr('Fetch complete'),
+                self.widget.tr('Fetch was completed successfully, changed refs:')
+                + '\n' + bullet_list(changed)
+        )
+        self.change_controller.populate_heads(moved)
 
     def process_push(self):
+        self.tasks.run(self.push_targets, done=self.push_dialog)
+
+    def push_targets(self):
         if not self.repo.head():
+            return None
+        refs = set(self.repo.refs())
+        remote = self.repo.remote()
+        for branch in self.repo.branches():
+            refs.add(f'{remote}/{branch}')
+        return refs
+
+    def push_dialog(self, refs: set[str]):
+        if refs is None:
             QMessageBox.critical(
                     self.widget,
                     self.widget.tr('Empty repository'),
                     self.widget.tr('Cannot push: the repository is empty')
             )
             return
-        refs = set(self.repo.refs())
-        remote = self.repo.remote()
-        for branch in self.repo.branches():
-            refs.add(f'{remote}/{branch}')
         ref, ok = QInputDialog.getItem(
                 self.widget,
                 self.widget.tr('Push'),
                 self.widget.tr('Push to:'),
-                refs, editable=False
+                sorted(refs), editable=False
         )
         if ok and ref:
-            try:
-                self.repo.push(ref)
-            except GitCommandError as ex:
-                QMessageBox.critical(
-                        self.widget,
-                        self.widget.tr('Git error'),
-                        ex.message
-                )
-            else:
-                QMessageBox.information(
-                        self.widget,
-                        self.widget.tr('Success'),
-                        self.widget.tr('Pushed successfully')
-                )
+            progress = self.tasks.git_progress()
+            self.tasks.run(
+                    self.repo.push, ref, progress,
+                    done=lambda _: self.push_done(),
+                    failed=self.transfer_failed,
+                    on_cancel=progress.cancel
+            )
+
+    def push_done(self):
+        QMessageBox.information(
+                self.widget,
+                self.widget.tr('Success'),
+                self.widget.tr('Pushed successfully')
+        )
+        self.change_controller.populate_heads()
+
+    def transfer_failed(self, ex: Exception):
+        error_handler(self.widget)(ex)
         self.change_controller.populate_heads()
 
     def change_switched(self, revision):
-        files, commit_msg = self.repo.commit_stat(revision)
+        self.tasks.run(
+                self.repo.commit_files, revision,
+                done=lambda commit_files: self.show_commit(revision, commit_files),
+                failed=error_handler(self.widget)
+        )
+
+    def show_match(self, revision: str, path: str = None):
+        ''' Select the commit and the file if given, e.g. from history search '''
+        self.commit_search.clear_filter()
+        self.pending_match = (revision, path)
+        self.change_controller.select_revision(revision)
+
+    def show_commit(self, revision, commit_files: tuple[list[str], str]):
+        files, commit_msg = commit_files
         self.populate_files(files)
+        if self.pending_match and self.pending_match[0] == revision:
+            self.select_file(self.pending_match[1])
+            self.pending_match = None
+        # whole patch is read once, file switches only slice it
+        self.tasks.run(
+                self.repo.commit_patch, revision,
+                failed=error_handler(self.widget)
+        )
+        # line counts are only shown as tooltips, load them after the listing
+        self.tasks.run(
+                self.repo.commit_numstat, revision,
+                done=lambda numstat: self.show_numstat(revision, numstat),
+                failed=error_handler(self.widget)
+        )
         self.ui.commit_msg.setPlainText(commit_msg)
 
+        self.diff_view.clear()
         self.ui.diff_widget.hide()
         self.ui.no_file.show()
         self.ui.no_commit.hide()
         self.ui.commit_msg_widget.show()
 
-    def file_switched(self, new_item):
-        if new_item is None:
+    def show_numstat(self, revision, numstat: dict[str, list[int]]):
+        if revision != self.change_controller.get_selected_revision():
+            return
+        self.file_model.set_numstat(numstat)
+
+    def select_file(self, path: str):
+        index = self.file_model.path_index(path) if path else QModelIndex()
+        if not index.isValid():
+            return
+        parent = index.parent()
+        while parent.isValid():
+            self.ui.files.expand(parent)
+            parent = parent.parent()
+        self.ui.files.setCurrentIndex(index)
+        self.ui.files.scrollTo(index)
+
+    def file_switched(self, index: QModelIndex):
+        column, role = self.PATH_DATA
+        path = index.siblingAtColumn(column).data(role) if index.isValid() else None
+        if path is None:
+            # directory
             return
         revision = self.change_controller.get_selected_revision()
-        diff = self.repo.diff(revision, new_item.data(*self.PATH_DATA))
-        self.ui.diff.setPlainText(diff)
+        if revision is None:
+            return
+        self.diff_view.show(revision, path)
         self.ui.diff_widget.show()
         self.ui.no_file.hide()
 
     def populate_files(self, files):
-        self.ui.files.clear()
-        if files:
-            root = list_to_tree(map(lambda file: f'{self.repo_name}/{file}', files))
-            root_item = self.tree_item(self.repo_name)
-            root.set_attrs({'item': root_item})
-            for node in preorder_iter(root):
-                if node == root:
-                    continue
-                file_path = node.path_name.removeprefix(f'/{self.repo_name}/')
-                item = self.tree_item(node.name, file_path)
-                node.set_attrs({'item': item})
-                node.parent.get_attr('item').addChild(item)
-            self.ui.files.addTopLevelItem(root_item)
-            self.ui.files.expandAll()
-
-    @classmethod
-    def tree_item(cls, name, path=None):
-        item = QTreeWidgetItem()
-        item.setText(0, name)
-        if path:
-            item.setData(*cls.PATH_DATA, path)
-        return item
+        self.file_model.reset(self.repo_name, files)
+        # directories of huge commits start collapsed
+        self.file_model.expand_small(self.ui.files, self.EXPAND_CHILDREN, self.EXPAND_ROWS)
@@ -1,18 +1,13 @@
+from asyncio import gather, run
+
 from PySide6.QtCore import QObject, Signal, Slot
 from PySide6.QtWidgets import QDialog, QMessageBox
 
-from .errors import show_error
+from .errors import error_handler, show_error, show_errors
 from .list_move import ListMoveController
 from .search import ListSearchController
-from api.commands.error import (
-        InvalidLoginError,
-        UserIsAdminError,
-        InvalidRepoNameError,
-        RepoNotFoundError,
-        RepoAllowedError,
-        RepoNotAllowedError,
-        CommandError,
-)
+from .tasks import TaskRunner
+from api.commands.error import CommandError
 from common import bullet_list, Role
 from ui import Ui_RepoUsers
 
@@ -43,6 +38,8 @@ class RepoUsersController:
         self.dialog = QDialog(parent)
         self.ui = Ui_RepoUsers()
         self.ui.setupUi(self.dialog)
+        self.tasks = TaskRunner(self.dialog)
+        self.dialog.finished.connect(self.tasks.shutdown)
 
         self.list_move = None
         self.populate_lists()
@@ -58,17 +55,34 @@ class RepoUsersController:
         self.ui.apply.clicked.connect(self.signals.apply)
         self.ui.reset.clicked.connect(self.signals.reset)
 
+    async def request_lists(self):
+        # both lists are requested concurrently
+        return await gather(
+                self.access_cmds.asynchronous().users(self.repo_name),
+                self.user_cmds.asynchronous().list(),
+                return_exceptions=True
+        )
+
     def populate_lists(self):
-        try:
-            allowed = set(self.access_cmds.users(self.repo_name))
-        except (InvalidRepoNameError, RepoNotFoundError, CommandError) as ex:
+        self.tasks.run(
+                lambda: run(self.request_lists()),
+                done=self.fill_lists,
+                failed=error_handler(self.dialog)
+        )
+
+    def fill_lists(self, results: list):
+        allowed, user_roles = results
+        for res in (allowed, user_roles):
+            if isinstance(res, BaseException) and not isinstance(res, CommandError):
+                raise res
+        if isinstance(allowed, CommandError):
+            show_error(self.dialog, allowed)
             allowed = set()
-            show_error(self.dialog, ex)
-        try:
-            user_roles = self.user_cmds.list()
-        except CommandError as ex:
+        else:
+            allowed = set(allowed)
+        if isinstance(user_roles, CommandError):
+            show_error(self.dialog, user_roles)
             user_roles = tuple()
-            show_error(self.dialog, ex)
 
         users = set(self.users_by_role(user_roles, Role.User))
         denied = users - allowed
@@ -87,6 +101,9 @@ class RepoUsersController:
                 self.ui.denied, self.ui.allow)
 
     def apply(self):
+        if self.list_move is None:
+            # lists are still being populated
+            return
         to_deny = self.list_move.diff(ListMoveController.Direction.Right)
         to_allow = self.list_move.diff(ListMoveController.Direction.Left)
         msg = []
@@ -104,32 +121,30 @@ class RepoUsersController:
                 self.dialog.tr('Apply user access?'),
                 '\n'.join(msg)
         )
-        if ok:
-            try:
-                for user in to_deny:
-                    try:
-                        self.access_cmds.deny(user, self.repo_name)
-                    except (
-                            InvalidLoginError,
-                            UserIsAdminError,
-                            RepoNotAllowedError
-                    ) as ex:
-                        show_error(self.dialog, ex)
-
-                for user in to_allow:
-                    try:
-                        self.access_cmds.allow(user, self.repo_name)
-                    except (
-                            InvalidLoginError,
-                            UserIsAdminError,
-                            RepoAllowedError
-                    ) as ex:
-                        show_error(self.dialog, ex)
-            except CommandError as ex:
-                show_error(self.dialog, ex)
+        if ok == QMessageBox.StandardButton.Yes:
+            self.tasks.run(
+                    self.access_cmds.apply, self.repo_name, to_allow, to_deny,
+                    done=self.applied,
+                    failed=self.apply_failed
+            )
+
+    def applied(self, failed: dict[str, CommandError]):
+        if failed:
+            show_errors(
+                    self.dialog,
+                    self.dialog.tr('Failed to change user access'),
+                    failed
+            )
+        self.populate_lists()
+
+    def apply_failed(self, ex: Exception):
+        error_handler(self.dialog)(ex)
+        self.populate_lists()
 
     def reset(self):
-       self.populate_lists()
+        self.access_cmds.invalidate(('users', self.repo_name))
+        self.user_cmds.invalidate(('list',))
+        self.populate_lists()
 
     @staticmethod
     def users_by_role(user_roles: list[tuple[str, str]], role: Role):
@@ -1,10 +1,201 @@
 from dataclasses import dataclass, field
-from functools import partial
+from enum import Enum
+from itertools import chain
+from typing import ClassVar
+import re
 
-from PySide6.QtCore import QObject, Slot
+from PySide6.QtCore import QAbstractProxyModel, QModelIndex, QObject, Qt, QTimer, Slot
+from PySide6.QtGui import QAction, QActionGroup
+from PySide6.QtWidgets import QMenu, QToolButton
+
+class SearchMode(Enum):
+    Substring = 'substring'
+    Tokens = 'tokens' # all words, in any order
+    Regex = 'regex'
+
+class SearchIndex:
+    ''' Case-folded texts of searched rows. A query that only extends
+    the previous one is checked against previous matches and new rows '''
+    def __init__(self):
+        self.texts = []
+        self.mode = SearchMode.Substring
+        self.query = ''
+        self.query_mode = self.mode
+        # matches of the query among the first `checked` rows
+        self.matches = None
+        self.checked = 0
+
+    def clear(self):
+        self.texts = []
+        self.matches = [] if self.query else None
+        self.checked = 0
+
+    def extend(self, texts: 'Iterable[str]'):
+        self.texts.extend(text.casefold() for text in texts)
+
+    @staticmethod
+    def matcher(query: str, mode: SearchMode):
+        ''' Return predicate for case-folded texts, raises re.error on bad regex '''
+        match mode:
+            case SearchMode.Substring:
+                query = query.casefold()
+                return lambda text: query in text
+            case SearchMode.Tokens:
+                tokens = query.casefold().split()
+                return lambda text: all(token in text for token in tokens)
+            case SearchMode.Regex:
+                return re.compile(query, re.IGNORECASE).search
+
+    def narrows(self, query: str):
+        ''' Whether every row matching query also matches the previous query '''
+        if self.matches is None or self.query_mode != self.mode:
+            return False
+        match self.mode:
+            case SearchMode.Substring:
+                return self.query.casefold() in query.casefold()
+            case SearchMode.Tokens:
+                tokens = query.casefold().split()
+                return all(any(old in new for new in tokens)
+                           for old in self.query.casefold().split())
+        return False
+
+    def search(self, query: str):
+        ''' Return sorted matching rows, None if the query is empty '''
+        if not query:
+            self.query = ''
+            self.matches = None
+            return None
+        matcher = self.matcher(query, self.mode)
+        if self.narrows(query):
+            rows = chain(self.matches, range(self.checked, len(self.texts)))
+        else:
+            rows = range(len(self.texts))
+        self.query = query
+        self.query_mode = self.mode
+        self.matches = [row for row in rows if matcher(self.texts[row])]
+        self.checked = len(self.texts)
+        return self.matches
+
+    def search_new(self):
+        ''' Return matches of the current query among rows added since last search '''
+        if self.matches is None:
+            return None
+        matcher = self.matcher(self.query, self.query_mode)
+        new = [row for row in range(self.checked, len(self.texts)) if matcher(self.texts[row])]
+        self.matches.extend(new)
+        self.checked = len(self.texts)
+        return new
+
+class FilterProxyModel(QAbstractProxyModel):
+    ''' Flat proxy showing sorted subset of source rows, all of them if rows is None '''
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = None
+        self.positions = {}
+
+    def setSourceModel(self, model: 'QAbstractItemModel'):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.rowsAboutToBeInserted.connect(self.source_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self.source_rows_inserted)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self.source_reset)
+        model.dataChanged.connect(self.source_data_changed)
+        self.endResetModel()
+
+    @Slot(QModelIndex, int, int)
+    def source_rows_about_to_be_inserted(self, parent, first, last):
+        if self.rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    @Slot(QModelIndex, int, int)
+    def source_rows_inserted(self, parent, first, last):
+        # filtered rows are added by the search controller
+        if self.rows is None:
+            self.endInsertRows()
+
+    @Slot()
+    def source_reset(self):
+        if self.rows is not None:
+            self.rows = []
+            self.positions = {}
+        self.endResetModel()
+
+    @Slot(QModelIndex, QModelIndex)
+    def source_data_changed(self, top_left, bottom_right):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            index = self.mapFromSource(self.sourceModel().index(row, 0))
+            if index.isValid():
+                self.dataChanged.emit(index, index.siblingAtColumn(self.columnCount() - 1))
+
+    def set_rows(self, rows: list[int]):
+        self.beginResetModel()
+        self.rows = rows
+        self.positions = {row: pos for pos, row in enumerate(rows)} if rows is not None else {}
+        self.endResetModel()
+
+    def append_rows(self, rows: list[int]):
+        if self.rows is None or not rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for pos, row in enumerate(rows, first):
+            self.positions[row] = pos
+        self.rows.extend(rows)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().rowCount() if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        return QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        row = proxy_index.row() if self.rows is None else self.rows[proxy_index.row()]
+        return self.sourceModel().index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = source_index.row() if self.rows is None else self.positions.get(source_index.row())
+        if row is None:
+            return QModelIndex()
+        return self.index(row, source_index.column())
+
+    def data(self, index, role=Qt.DisplayRole):
+        return self.sourceModel().data(self.mapToSource(index), role)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Vertical and self.rows is not None:
+            if section >= len(self.rows):
+                return None
+            section = self.rows[section]
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.sourceModel().canFetchMore(QModelIndex())
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self.sourceModel().fetchMore(QModelIndex())
 
 @dataclass(frozen=True)
 class SearchController:
+    ''' Filters rows as the user types, after DEBOUNCE_MS without typing '''
     class Signals(QObject):
         def __init__(self, control):
             super().__init__()
@@ -14,66 +205,193 @@ class SearchController:
         def perform_search(self):
             self.control.perform_search()
 
+        @Slot()
+        def schedule_search(self):
+            self.control.timer.start()
+
+        @Slot(QAction)
+        def set_mode(self, action):
+            self.control.set_mode(action.data())
+
+    DEBOUNCE_MS: ClassVar[int] = 250
+    MODE_NAMES: ClassVar[dict] = {
+            SearchMode.Substring: 'Contains text',
+            SearchMode.Tokens: 'Contains all words',
+            SearchMode.Regex: 'Regular expression',
+    }
+
     search_box: 'PySide6.QtWidgets.QLineEdit'
     search_btn: 'PySide6.QtWidgets.QToolButton'
     signals: Signals = field(init=False)
+    index: SearchIndex = field(init=False, default_factory=SearchIndex)
+    timer: QTimer = field(init=False)
 
     def __post_init__(self):
         super().__setattr__('signals', self.Signals(self))
+        super().__setattr__('timer', QTimer(self.search_box))
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.DEBOUNCE_MS)
+        self.timer.timeout.connect(self.signals.perform_search)
         self.search_btn.clicked.connect(self.signals.perform_search)
         self.search_box.returnPressed.connect(self.signals.perform_search)
+        self.search_box.textChanged.connect(self.signals.schedule_search)
+        self.setup_mode_menu()
+
+    def setup_mode_menu(self):
+        menu = QMenu(self.search_btn)
+        group = QActionGroup(menu)
+        for mode, name in self.MODE_NAMES.items():
+            action = menu.addAction(self.search_btn.tr(name))
+            action.setData(mode)
+            action.setCheckable(True)
+            action.setChecked(mode == self.index.mode)
+            group.addAction(action)
+        group.triggered.connect(self.signals.set_mode)
+        self.search_btn.setMenu(menu)
+        self.search_btn.setPopupMode(QToolButton.MenuButtonPopup)
+
+    def set_mode(self, mode: SearchMode):
+        self.index.mode = mode
+        self.perform_search()
 
     def perform_search(self):
-        query = self.search_box.text()
-        for item in self.items:
-            item.set_hidden(query not in item.text)
+        self.timer.stop()
+        self.sync_index()
+        try:
+            matches = self.index.search(self.search_box.text())
+        except re.error as ex:
+            # keep the last filter until the pattern is fixed
+            self.search_box.setToolTip(str(ex))
+            return
+        self.search_box.setToolTip('')
+        self.apply(matches)
 
     def clear_filter(self):
         self.search_box.clear()
-        for item in self.items:
-            item.setHidden(False)
+        self.timer.stop()
+        self.index.search('')
+        self.apply(None)
+
+    def sync_index(self):
+        ''' Bring index up to date with searched rows '''
+        raise NotImplementedError
+
+    def apply(self, matches: list[int]):
+        ''' Show only matching rows, all of them if matches is None '''
+        raise NotImplementedError
 
 @dataclass(frozen=True)
 class ListSearchController(SearchController):
+    ''' Search in a list widget, only rows that change visibility are touched '''
+    class Signals(SearchController.Signals):
+        @Slot(QModelIndex, int, int)
+        def rows_inserted(self, parent, first, last):
+            self.control.rows_inserted(first, last)
+
+        @Slot()
+        def invalidate(self):
+            self.control.invalidate()
+
     list_widget: 'PySide6.QtWidgets.QListWidget'
+    hidden: set[int] = field(init=False, default_factory=set)
+    stale: bool = field(init=False, default=True)
 
-    @dataclass(frozen=True)
-    class ListSearchItem:
-        list_item: 'QListWidgetItem'
+    def __post_init__(self):
+        super().__post_init__()
+        model = self.list_widget.model()
+        model.rowsInserted.connect(self.signals.rows_inserted)
+        model.rowsRemoved.connect(self.signals.invalidate)
+        model.rowsMoved.connect(self.signals.invalidate)
+        model.modelReset.connect(self.signals.invalidate)
+        model.dataChanged.connect(self.signals.invalidate)
 
-        @property
-        def text(self):
-            return self.list_item.text()
+    def rows_inserted(self, first: int, last: int):
+        if self.stale or first != len(self.index.texts):
+            self.invalidate()
+            if self.index.query:
+                self.perform_search()
+            return
+        self.index.extend(self.list_widget.item(row).text() for row in range(first, last + 1))
+        new = self.index.search_new()
+        if new is None:
+            return
+        # items added under an active filter
+        hidden = set(range(first, last + 1)).difference(new)
+        for row in hidden:
+            self.list_widget.item(row).setHidden(True)
+        self.hidden.update(hidden)
 
-        def set_hidden(self, hidden: bool):
-            self.list_item.setHidden(hidden)
+    def invalidate(self):
+        super().__setattr__('stale', True)
 
-    @property
-    def items(self):
-        def make_item(idx):
-            return self.ListSearchItem(self.list_widget.item(idx))
-        return map(make_item, range(self.list_widget.count()))
+    def sync_index(self):
+        if not self.stale:
+            return
+        count = self.list_widget.count()
+        self.index.clear()
+        self.index.extend(self.list_widget.item(row).text() for row in range(count))
+        self.hidden.clear()
+        self.hidden.update(row for row in range(count) if self.list_widget.item(row).isHidden())
+        super().__setattr__('stale', False)
+
+    def apply(self, matches: list[int]):
+        if matches is None:
+            hidden = set()
+        else:
+            hidden = set(range(self.list_widget.count())).difference(matches)
+        for row in hidden.symmetric_difference(self.hidden):
+            self.list_widget.item(row).setHidden(row in hidden)
+        self.hidden.clear()
+        self.hidden.update(hidden)
 
 @dataclass(frozen=True)
 class TableSearchController(SearchController):
-    table_widget: 'PySide6.QtWidgets.QTableWidget'
-    search_col: int
+    ''' Search in a view over FilterProxyModel, rows loaded later are indexed
+    and filtered as they arrive '''
+    class Signals(SearchController.Signals):
+        @Slot(QModelIndex, int, int)
+        def rows_inserted(self, parent, first, last):
+            self.control.rows_inserted(first, last)
 
-    @dataclass(frozen=True)
-    class TableSearchItem:
-        table_widget: 'PySide6.QtWidgets.QTableWidget'
-        row: int
-        search_col: int
+        @Slot()
+        def model_reset(self):
+            self.control.model_reset()
+
+    table_view: 'PySide6.QtWidgets.QTableView'
+    search_col: int
 
-        @property
-        def text(self):
-            return self.table_widget.item(self.row, self.search_col).text()
+    def __post_init__(self):
+        super().__post_init__()
+        source = self.proxy.sourceModel()
+        source.rowsInserted.connect(self.signals.rows_inserted)
+        source.modelReset.connect(self.signals.model_reset)
+        self.model_reset()
 
-        def set_hidden(self, hidden: bool):
-            self.table_widget.setRowHidden(self.row, hidden)
-    
     @property
-    def items(self):
-        def make_item(row_idx):
-            return self.TableSearchItem(self.table_widget, row_idx, self.search_col)
-        return map(make_item, range(self.table_widget.rowCount()))
+    def proxy(self) -> FilterProxyModel:
+        return self.table_view.model()
+
+    def texts(self, first: int, last: int):
+        source = self.proxy.sourceModel()
+        for row in range(first, last + 1):
+            yield source.index(row, self.search_col).data() or ''
+
+    def rows_inserted(self, first: int, last: int):
+        if first != len(self.index.texts):
+            # not an append, reindex everything
+            self.model_reset()
+            self.perform_search()
+            return
+        self.index.extend(self.texts(first, last))
+        self.proxy.append_rows(self.index.search_new())
+
+    def model_reset(self):
+        self.index.clear()
+        self.index.extend(self.texts(0, self.proxy.sourceModel().rowCount() - 1))
+
+    def sync_index(self):
+        # kept in sync by model signals
+        pass
+
+    def apply(self, matches: list[int]):
+        self.proxy.set_rows(None if matches is None else list(matches))
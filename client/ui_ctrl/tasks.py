@@ -0,0 +1,160 @@
+import sys
+from contextlib import nullcontext
+from threading import Lock
+from time import perf_counter
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+
+from api.git import GitProgress
+
+# rows streamed to the GUI go in batches, at least this often while they come
+BATCH_SIZE = 100
+BATCH_INTERVAL = 0.1
+
+def emit_batches(rows: 'Iterable', emit: 'Callable[[list], None]'):
+    ''' Pass rows to emit in batches, e.g. from a worker to a signal.
+    Returns the number of rows '''
+    count = 0
+    batch = []
+    sent = perf_counter()
+    for row in rows:
+        batch.append(row)
+        count += 1
+        if len(batch) == BATCH_SIZE or perf_counter() - sent > BATCH_INTERVAL:
+            emit(batch)
+            batch = []
+            sent = perf_counter()
+    if batch:
+        emit(batch)
+    return count
+
+class Task(QRunnable):
+    ''' Function call run on a worker thread, its outcome is signalled back '''
+    class Signals(QObject):
+        finished = Signal((object,))
+        failed = Signal((object,))
+        cancelled = Signal()
+
+    def __init__(self, func, *args, **kw):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.func = func
+        self.args = args
+        self.kw = kw
+        self.signals = self.Signals()
+        self.cancelled = False
+        self.cancel_callbacks = []
+        self.lock = Lock()
+        # held while func runs, see TaskRunner
+        self.guard = None
+
+    def on_cancel(self, callback: 'Callable[[], None]'):
+        with self.lock:
+            if not self.cancelled:
+                self.cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            callbacks, self.cancel_callbacks = self.cancel_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def run(self):
+        with self.guard or nullcontext():
+            self.call()
+
+    def call(self):
+        if self.cancelled:
+            self.signals.cancelled.emit()
+            return
+        try:
+            res = self.func(*self.args, **self.kw)
+        except Exception as ex:
+            # failure caused by cancellation is not reported
+            if self.cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(ex)
+        else:
+            self.signals.finished.emit(res)
+
+class TaskRunner(QObject):
+    ''' Runs tasks off the GUI thread, serially unless max_threads is raised.
+    Each task holds guard, if given, e.g. a lock shared with other runners.
+    Callbacks are called on the GUI thread '''
+    busy_changed = Signal((bool,))
+    progress_changed = Signal((int, int, str))
+    report_progress = Signal((int, int, str))
+
+    def __init__(self,
+                 parent: QObject = None,
+                 max_threads: int = 1,
+                 guard: 'ContextManager' = None):
+        super().__init__(parent)
+        self.guard = guard
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.tasks = set()
+        self.progress = None
+        self.closed = False
+        # progress is reported from worker threads
+        self.report_progress.connect(self.set_progress)
+
+    def run(self, func, *args, done=None, failed=None, on_cancel=None, **kw):
+        ''' Run func(*args, **kw) on the pool, pass its result to done
+        or its exception to failed. Returns the task '''
+        task = Task(func, *args, **kw)
+        task.guard = self.guard
+        if on_cancel:
+            task.on_cancel(on_cancel)
+        task.signals.finished.connect(lambda res: self.task_done(task, done, res))
+        task.signals.failed.connect(
+                lambda ex: self.task_done(task, failed or self.reraise, ex))
+        task.signals.cancelled.connect(lambda: self.task_done(task))
+        was_busy = self.is_busy()
+        self.tasks.add(task)
+        self.pool.start(task)
+        if not was_busy:
+            self.busy_changed.emit(True)
+        return task
+
+    def git_progress(self):
+        ''' Progress of git transfer reported by this runner '''
+        return GitProgress(self.report_progress.emit)
+
+    def is_busy(self):
+        return bool(self.tasks)
+
+    def cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def shutdown(self):
+        ''' Cancel tasks and drop their callbacks, the owner is going away '''
+        self.closed = True
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    @Slot(int, int, str)
+    def set_progress(self, current, maximum, message):
+        if self.is_busy():
+            self.progress = (current, maximum, message)
+            self.progress_changed.emit(current, maximum, message)
+
+    def task_done(self, task, callback=None, arg=None):
+        if self.closed:
+            return
+        self.tasks.discard(task)
+        if not self.tasks:
+            self.progress = None
+            self.busy_changed.emit(False)
+        if callback:
+            callback(arg)
+
+    @staticmethod
+    def reraise(ex: Exception):
+        sys.excepthook(type(ex), ex, ex.__traceback__)
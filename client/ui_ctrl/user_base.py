@@ -1,25 +1,27 @@
+from functools import partial
+
 from PySide6.QtCore import QObject, Signal, Slot
 from PySide6.QtWidgets import QMessageBox, QInputDialog, QLineEdit
 
 from .create_user import CreateUserController
-from .errors import show_error
-from api.commands.error import (
-        InvalidLoginError, 
-        UserExistsError, 
-        UserNotFoundError,
-        UserIsAdminError,
-        CommandError,
-)
+from .errors import error_handler
+from .tasks import TaskRunner, emit_batches
 from common import Role
 
 class UserControllerBase:
     class Signals(QObject):
         users_updated = Signal()
+        # emitted from the worker with batches of (login, role) rows
+        users_found = Signal((int, object))
 
         def __init__(self, control):
             super().__init__()
             self.control = control
 
+        @Slot(int, object) # list
+        def add_users(self, generation, user_roles):
+            self.control.add_users(generation, user_roles)
+
         @Slot(str, str)
         def create_user(self, login, passwd):
             self.control.create_user(login, passwd)
@@ -28,6 +30,12 @@ class UserControllerBase:
         self.dialog = dialog
         self.user_cmds = user_cmds
         self.signals = self.Signals(self)
+        self.signals.users_found.connect(self.signals.add_users)
+        self.tasks = TaskRunner(self.dialog)
+        # rows streamed for a previous listing are dropped
+        self.generation = 0
+        self.user_lists = (None, None)
+        self.dialog.finished.connect(self.tasks.shutdown)
 
     def replace_ssh(self, user_cmds: 'api.commands.UserPackage'):
         self.user_cmds = user_cmds
@@ -36,12 +44,28 @@ class UserControllerBase:
     def get_selected_user(list_widget: 'QListWidget'):
         return list_widget.selectedItems()[0].text()
 
-    def populate_users(self, user_list: 'QListWidget', admin_list: 'QListWidget' = None):
+    def populate_users(self,
+                       user_list: 'QListWidget',
+                       admin_list: 'QListWidget' = None):
+        ''' Refill the lists as the server lists users '''
+        self.generation += 1
+        generation = self.generation
+        self.user_lists = (user_list, admin_list)
         user_list.clear()
         if admin_list:
             admin_list.clear()
+        self.tasks.run(
+                lambda: emit_batches(
+                        self.user_cmds.iter_list(),
+                        partial(self.signals.users_found.emit, generation)),
+                failed=error_handler(self.dialog)
+        )
 
-        for user, role in self.user_cmds.list():
+    def add_users(self, generation: int, user_roles: list[tuple[str, str]]):
+        if generation != self.generation:
+            return
+        user_list, admin_list = self.user_lists
+        for user, role in user_roles:
             match Role(role):
                 case Role.User:
                     user_list.addItem(user)
@@ -55,12 +79,11 @@ class UserControllerBase:
         dialog.dialog.exec()
 
     def create_user(self, login: str, passwd: str):
-        try:
-            self.user_cmds.create(login, passwd)
-        except (InvalidLoginError, UserExistsError, CommandError) as ex:
-            show_error(self.dialog, ex)
-        else:
-            self.signals.users_updated.emit()
+        self.tasks.run(
+                self.user_cmds.create, login, passwd,
+                done=lambda _: self.signals.users_updated.emit(),
+                failed=error_handler(self.dialog)
+        )
 
     def delete_user_dialog(self, login: str):
         ok = QMessageBox.question(
@@ -69,17 +92,11 @@ class UserControllerBase:
                 self.dialog.tr('Delete user {}?').format(login)
         )
         if ok == QMessageBox.StandardButton.Yes:
-            try:
-                self.user_cmds.delete(login)
-            except (
-                    InvalidLoginError,
-                    UserNotFoundError,
-                    UserIsAdminError,
-                    CommandError
-            ) as ex:
-                show_error(self.dialog, ex)
-            else:
-                self.signals.users_updated.emit()
+            self.tasks.run(
+                    self.user_cmds.delete, login,
+                    done=lambda _: self.signals.users_updated.emit(),
+                    failed=error_handler(self.dialog)
+            )
 
     def change_password_dialog(self, login: str):
         passwd, ok = QInputDialog.getText(
@@ -90,18 +107,15 @@ class UserControllerBase:
         )
         if ok:
             if passwd:
-                try:
-                    self.user_cmds.passwd(login, passwd)
-                except (
-                        InvalidLoginError,
-                        InvalidPasswordError,
-                        UserIsAdminError,
-                        CommandError
-                ) as ex:
-                    show_error(self.dialog, ex)
-                else:
-                    QMessageBox.information(
-                            self.dialog,
-                            self.dialog.tr('Success'),
-                            self.dialog.tr('Password for {} was changed succesfully').format(login)
-                    )
+                self.tasks.run(
+                        self.user_cmds.passwd, login, passwd,
+                        done=lambda _: self.password_changed(login),
+                        failed=error_handler(self.dialog)
+                )
+
+    def password_changed(self, login: str):
+        QMessageBox.information(
+                self.dialog,
+                self.dialog.tr('Success'),
+                self.dialog.tr('Password for {} was changed succesfully').format(login)
+        )
@@ -1,17 +1,9 @@
 from PySide6.QtWidgets import QDialog, QMessageBox
 from PySide6.QtCore import QObject, Slot
 
-from .errors import show_error
+from .errors import error_handler, show_errors
 from .list_move import ListMoveController
 from .user_base import UserControllerBase
-from api.commands.error import (
-        InvalidLoginError, 
-        UserExistsError, 
-        UserNotFoundError,
-        UserIsAdminError,
-        UserNotAdminError,
-        CommandError,
-)
 from common import bullet_list
 from ui import Ui_UsersOwner
 
@@ -78,17 +70,17 @@ class OwnerUserController(UserControllerBase):
         self.ui.users.itemSelectionChanged.connect(self.owner_signals.update_user_buttons)
 
     def populate_users(self):
-        try:
-            super().populate_users(self.ui.users, self.ui.admins)
-        except CommandError as ex:
-            show_error(self.dialog, ex)
-        else:
-            if self.list_move:
-                self.list_move.disconnect()
-            self.list_move = ListMoveController(
-                    self.ui.users, self.ui.to_admins,
-                    self.ui.admins, self.ui.to_users,
-            )
+        super().populate_users(self.ui.users, self.ui.admins)
+        # moves are tracked from the start, rows keep coming meanwhile
+        self.reset_list_move()
+
+    def reset_list_move(self):
+        if self.list_move:
+            self.list_move.disconnect()
+        self.list_move = ListMoveController(
+                self.ui.users, self.ui.to_admins,
+                self.ui.admins, self.ui.to_users,
+        )
     
     def apply(self):
         to_promote = self.list_move.diff(ListMoveController.Direction.Right)
@@ -101,23 +93,38 @@ class OwnerUserController(UserControllerBase):
         if to_demote:
             msg.append(self.dialog.tr('Admins to demote:'))
             msg.append(bullet_list(to_demote))
+        if not msg:
+            return
 
         ok = QMessageBox.question(
                 self.dialog,
                 self.dialog.tr('Promotion/Demotion'),
                 '\n'.join(msg)
         )
-        if ok:
-            for user in to_promote:
-                try:
-                    self.admin_cmds.promote(user)
-                except (UserNotFoundError, UserIsAdminError, CommandError) as ex:
-                    show_error(self.dialog, ex)
-            for user in to_demote:
-                try:
-                    self.admin_cmds.demote(user)
-                except (UserNotFoundError, UserNotAdminError, CommandError) as ex:
-                    show_error(self.dialog, ex)
+        if ok == QMessageBox.StandardButton.Yes:
+            self.tasks.run(
+                    self.admin_cmds.apply, to_promote, to_demote,
+                    done=self.applied,
+                    failed=self.apply_failed
+            )
+        else:
+            self.populate_users()
+
+    def applied(self, failed: dict[str, 'CommandError']):
+        if failed:
+            show_errors(
+                    self.dialog,
+                    self.dialog.tr('Failed to change admin rights'),
+                    failed
+            )
+        self.populate_users()
+
+    def apply_failed(self, ex: Exception):
+        error_handler(self.dialog)(ex)
+        self.populate_users()
+
+    def discard(self):
+        self.user_cmds.invalidate(('list',))
         self.populate_users()
 
     def update_user_buttons(self):
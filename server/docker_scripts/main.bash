@@ -29,6 +29,16 @@ fi
 chmod -R 775 "${ROOT_DIR}/repos"
 chown -R "${OWNER_USER}:${ADMIN_GRP}" "${ROOT_DIR}/repos"
 
+# Rebuild access index from users' repo links if it is missing
+acl_dir="${ROOT_DIR}/acl"
+mkdir -p "$acl_dir"
+if ! [ -f "${acl_dir}/acl.db" ]; then
+    (cd "${ROOT_DIR}/scripts" && ./access rebuild)
+fi
+chown -R "${OWNER_USER}:${ADMIN_GRP}" "$acl_dir"
+chmod 2775 "$acl_dir"
+chmod 664 "${acl_dir}/acl.db"
+
 # Run ssh service
 service ssh start
 
@@ -18,6 +18,10 @@ make_pkg() {
 chmod 550 __*
 chown "$OWNER_USER":"$USER_GRP" __*
 
+# Batch entry point, packages it runs keep their own permissions
+chmod 550 batch
+chown "$OWNER_USER":"$USER_GRP" batch
+
 # Packages themselves
 make_pkg self   "$USER_GRP"
 make_pkg user   "$ADMIN_GRP"
@@ -10,3 +10,4 @@ USER_GRP=user
 REPO_DIR=repos
 USER_DIR=users
 PASSWD_DIR=passwd
+ACL_DIR=acl